@@ -2,12 +2,39 @@
 Flask application for "What Would They Say?" Advisor
 """
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, make_response, Response, stream_with_context, url_for
+import click
 import os
+import json
+import queue
+import asyncio
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from prompts.personalities import get_personality, PERSONALITIES
-from utils.rag_pipeline import RAGPipeline
-from langchain_openai import ChatOpenAI
+from prompts.registry import (
+    get_personality, ENABLED_PERSONALITIES, RAG_PERSONALITIES, SELECT_PERSONALITIES,
+    PERSONALITY_LISTING, PERSONALITY_LISTING_ETAG
+)
+from utils.rag_pipeline import RAGPipeline, create_embeddings, VECTOR_BACKEND
+from utils.response_cache import ResponseCache
+from utils.retrieval_cache import RetrievalCache
+from utils.corpus import CORPORA
+from utils.clients import get_chat_model
+from utils import clients
+from utils.admission import Overloaded
+from utils.scheduler import (
+    upstream, coalesced_requests, deadline_scope, deadline_seconds, retry_after_header,
+    RateLimited, DeadlineExceeded
+)
+from utils.embedding_cache import normalize_text
+from utils.conversation import create_conversation_store, add_history, new_session_id, valid_session_id
+from utils.batch import BatchRunner, read_tasks, BATCH_SIZE, BATCH_CONCURRENCY
+from utils.assets import (
+    build_assets, load_manifest, is_fingerprinted, picture, CompressedPage, PageCache, ASSET_MAX_AGE
+)
+from utils import metrics
 
 # Load environment variables
 load_dotenv()
@@ -15,38 +42,167 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
-# Store RAG pipeline for Steve Jobs (initialized on first use)
-steve_jobs_pipeline = None
+# RAG pipelines by personality id (built on first use, or up front by preload)
+pipelines = {}
+# Guards setup_locks; each personality's pipeline is set up under its own lock
+pipelines_lock = threading.Lock()
+setup_locks = {}
 
+# Personalities that can be chatted with (the 'enabled' flag in prompts/personalities.py)
+AVAILABLE_PERSONALITIES = ENABLED_PERSONALITIES
 
-def get_steve_jobs_pipeline():
-    """Get or create RAG pipeline for Steve Jobs"""
-    global steve_jobs_pipeline
-    if steve_jobs_pipeline is None:
-        documents_path = "steve_job_pdf.pdf"
-        steve_jobs_pipeline = RAGPipeline("steve_jobs", documents_path)
-        steve_jobs_pipeline.setup()
-    return steve_jobs_pipeline
+# Bounded pool shared by all fan-out requests, so a burst of /api/chat/multi
+# calls cannot open an unbounded number of upstream LLM calls
+MULTI_CHAT_WORKERS = int(os.getenv("MULTI_CHAT_WORKERS", "8"))
+multi_chat_executor = ThreadPoolExecutor(
+    max_workers=MULTI_CHAT_WORKERS,
+    thread_name_prefix="multi-chat"
+)
 
+# Embeddings shared by retrieval and the response cache, so a question is
+# embedded at most once per request
+query_embeddings = create_embeddings()
 
-def query_with_system_prompt(personality_id, message):
+# Cache of answers for repeated and near-duplicate questions
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+response_cache = ResponseCache(
+    query_embeddings,
+    threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "500"))
+)
+
+# Retrieved chunks for repeated questions, suggested prompts above all
+retrieval_cache = RetrievalCache()
+
+# Conversation history per session and personality
+conversations = create_conversation_store()
+
+# Fingerprinted images from `flask --app app assets` (empty until it is run)
+asset_manifest = load_manifest(app.static_folder)
+
+# Pages that are the same for every request, rendered and compressed once
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "1") == "1"
+page_cache = PageCache()
+
+
+def get_pipeline(personality_id):
+    """
+    Get or create the RAG pipeline for a personality
+
+    Setting up one personality's pipeline only blocks requests for that
+    personality, so different personalities load in parallel.
+    """
+    pipeline = pipelines.get(personality_id)
+    if pipeline is None:
+        with pipelines_lock:
+            setup_lock = setup_locks.setdefault(personality_id, threading.Lock())
+        with setup_lock:
+            pipeline = pipelines.get(personality_id)
+            if pipeline is None:
+                pipeline = RAGPipeline(
+                    personality_id,
+                    CORPORA[personality_id],
+                    embeddings=query_embeddings,
+                    retrieval_cache=retrieval_cache,
+                    suggested_prompts=get_personality(personality_id).get("suggested_prompts", [])
+                )
+                pipeline.setup()
+                pipelines[personality_id] = pipeline
+    return pipeline
+
+
+def preload_pipelines():
+    """
+    Build or load every personality's index up front, in parallel
+
+    Returns:
+        dict mapping personality id to an error message for the pipelines
+        that failed to load (empty when everything is ready)
+    """
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(len(RAG_PERSONALITIES), 1)) as executor:
+        futures = {
+            executor.submit(get_pipeline, personality_id): personality_id
+            for personality_id in RAG_PERSONALITIES
+        }
+        for future in as_completed(futures):
+            personality_id = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Failed to preload pipeline for {personality_id}: {str(e)}")
+                errors[personality_id] = str(e)
+    return errors
+
+
+def build_indexes():
+    """
+    Build every personality's index on disk without loading it in this process
+
+    Used by the gunicorn master so the index is written exactly once before
+    any worker starts; each worker then only has to open it. The build runs
+    in a forked child, so no vector store client is left in the master for
+    the workers to inherit (Chroma's stops working across a fork).
+    """
+    with multiprocessing.get_context("fork").Pool(1) as pool:
+        return pool.apply(preload_pipelines)
+
+
+def preload_for_fork():
+    """
+    Load what processes forked from this one can share
+
+    numpy indexes are loaded in full: the matrix is a read-only memory map
+    and the BM25 index and chunk records are never written, so forked
+    workers share them copy-on-write. Chroma indexes are only built, and
+    each worker opens its own.
+    """
+    if VECTOR_BACKEND != "numpy":
+        return build_indexes()
+    return preload_pipelines()
+
+
+def reopen_after_fork():
+    """
+    Drop connections inherited from the process this one was forked from
+
+    HTTP connection pools hold sockets (and the async one, event loop state)
+    that must not be shared between processes, so each worker opens its own
+    on first use. The embedding cache already opens its sqlite connection
+    per process.
+    """
+    clients.reset()
+
+
+NO_CONTEXT = "[No specific source material available, respond based on general knowledge of this person's philosophy and style]"
+
+
+def create_llm(personality_id=None):
+    """Get the shared chat model used for system-prompt-only personalities"""
+    return get_chat_model(personality_id)
+
+
+def query_with_system_prompt(personality_id, message, history=""):
     """
     Query a personality using just the system prompt (no RAG)
-    Used for Kobe Bryant and Marcus Aurelius
+    Used for personalities with the 'prompt' backend (no source documents)
     """
     personality = get_personality(personality_id)
     if not personality:
         return {"error": "Personality not found"}
 
     # Format the system prompt with empty context
-    prompt = personality['system_prompt'].format(
-        context="[No specific source material available, respond based on general knowledge of this person's philosophy and style]",
-        question=message
-    )
+    with metrics.stage(personality_id, "prompt"):
+        prompt = personality['template'].format(
+            context=add_history(NO_CONTEXT, history),
+            question=message
+        )
 
     # Get LLM response
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
-    response = llm.invoke(prompt)
+    with metrics.stage(personality_id, "llm"):
+        response = upstream.call(create_llm(personality_id).invoke, prompt, timeout_arg="timeout")
+    metrics.record_usage(personality_id, response)
 
     return {
         "response": response.content,
@@ -54,80 +210,762 @@ def query_with_system_prompt(personality_id, message):
     }
 
 
+async def aquery_with_system_prompt(personality_id, message, history=""):
+    """
+    Query a personality using just the system prompt (no RAG), from async code
+
+    Same result as query_with_system_prompt; the LLM call waits for an
+    upstream slot from the admission controller and is cancelled at the deadline
+    """
+    personality = get_personality(personality_id)
+    if not personality:
+        return {"error": "Personality not found"}
+
+    with metrics.stage(personality_id, "prompt"):
+        prompt = personality['template'].format(
+            context=add_history(NO_CONTEXT, history),
+            question=message
+        )
+
+    with metrics.stage(personality_id, "llm"):
+        response = await upstream.acall(create_llm(personality_id).ainvoke, prompt)
+    metrics.record_usage(personality_id, response)
+
+    return {
+        "response": response.content,
+        "sources": []
+    }
+
+
+def stream_with_system_prompt(personality_id, message, history=""):
+    """
+    Stream a personality's answer using just the system prompt (no RAG)
+
+    Yields the same events as RAGPipeline.stream_query, with empty sources
+    """
+    personality = get_personality(personality_id)
+    if not personality:
+        yield {"type": "error", "error": "Personality not found"}
+        return
+
+    yield {"type": "sources", "sources": []}
+
+    with metrics.stage(personality_id, "prompt"):
+        prompt = personality['template'].format(
+            context=add_history(NO_CONTEXT, history),
+            question=message
+        )
+    yield from metrics.timed_stream(
+        personality_id,
+        upstream.stream(create_llm(personality_id).stream, prompt, timeout_arg="timeout")
+    )
+
+
+def response_cache_scope(personality_id, message):
+    """
+    (index version, semantic) for a personality's cached answers to a message
+
+    Answers are tied to the index they were retrieved from. Near-duplicate
+    questions are only matched when answering the message embeds it anyway:
+    for RAG personalities whose retrieval isn't served by the lexical fast
+    path. Everything else is matched exactly, so the cache never makes an
+    embeddings call of its own.
+    """
+    if get_personality(personality_id)['backend'] != 'rag':
+        return None, False
+    pipeline = pipelines.get(personality_id)
+    if pipeline is None:
+        # Nothing is cached before the pipeline has answered once
+        return None, False
+    return pipeline.index_version, pipeline.embeds_question(message)
+
+
+def lookup_cached_response(personality_id, message):
+    """Return a cached answer for the message, or None"""
+    try:
+        version, semantic = response_cache_scope(personality_id, message)
+        with metrics.stage(personality_id, "cache_lookup"):
+            cached = response_cache.lookup(personality_id, message, version=version, semantic=semantic)
+    except Exception as e:
+        # A cache failure should never fail the chat itself
+        print(f"Response cache lookup failed: {str(e)}")
+        metrics.record_error(personality_id, "cache_lookup")
+        return None
+    metrics.record_cache_lookup(personality_id, cached is not None)
+    if cached is None:
+        return None
+    return dict(cached, cached=True)
+
+
+def store_cached_response(personality_id, message, result):
+    """Cache the answer to a message"""
+    try:
+        version, semantic = response_cache_scope(personality_id, message)
+        response_cache.store(personality_id, message, {
+            "response": result['response'],
+            "sources": result.get('sources', [])
+        }, version=version, semantic=semantic)
+    except Exception as e:
+        print(f"Response cache store failed: {str(e)}")
+        metrics.record_error(personality_id, "cache_store")
+
+
+def request_session_id(data):
+    """
+    The session a chat request belongs to, or None to answer it without one
+
+    Clients continue a conversation by sending back the session_id they were
+    given, and start one with 'start_session': true. Requests with neither
+    are not remembered, so one-off API calls don't push real conversations
+    out of the store.
+    """
+    if data.get('session_id'):
+        return data['session_id']
+    if data.get('start_session'):
+        return new_session_id()
+    return None
+
+
+def event_stream_headers(session_id):
+    """Headers of a server-sent events response, with the session's id when there is one"""
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if session_id:
+        headers["X-Session-Id"] = session_id
+    return headers
+
+
+def conversation_history(personality_id, session_id):
+    """The conversation so far in a session, empty without one"""
+    if not session_id:
+        return ""
+    return conversations.history(session_id, personality_id)
+
+
+def remember_turn(personality_id, session_id, message, result):
+    """Add an answered message to the session's conversation"""
+    if not session_id or 'error' in result:
+        return
+    try:
+        conversations.append(session_id, personality_id, message, result['response'])
+    except Exception as e:
+        print(f"Conversation update failed: {str(e)}")
+        metrics.record_error(personality_id, "conversation")
+
+
+def coalesce_key(personality_id, message):
+    """
+    Key under which identical questions to a personality share one answer
+
+    Only called with requests that have been validated (message is a string)
+    """
+    return (personality_id, normalize_text(message))
+
+
+def answer_personality(personality_id, message, history=""):
+    """Answer a message with retrieval and generation, bypassing every cache"""
+    personality = get_personality(personality_id)
+
+    # Handle personalities with source documents with RAG
+    if personality['backend'] == 'rag':
+        pipeline = get_pipeline(personality_id)
+        return pipeline.query(
+            question=message,
+            system_prompt_template=personality['template'],
+            history=history,
+            token_budget=personality['prompt_token_budget']
+        )
+    # Handle the rest with system prompt only
+    return query_with_system_prompt(personality_id, message, history)
+
+
+async def aanswer_personality(personality_id, message, history=""):
+    """Async version of answer_personality"""
+    personality = get_personality(personality_id)
+
+    if personality['backend'] == 'rag':
+        pipeline = pipelines.get(personality_id)
+        if pipeline is None:
+            pipeline = await asyncio.to_thread(get_pipeline, personality_id)
+        return await pipeline.aquery(
+            question=message,
+            system_prompt_template=personality['template'],
+            history=history,
+            token_budget=personality['prompt_token_budget']
+        )
+    return await aquery_with_system_prompt(personality_id, message, history)
+
+
+def query_personality(personality_id, message, use_cache=True, session_id=None):
+    """
+    Route a message to the query for a personality
+
+    Cached answers are returned without retrieval or generation unless
+    use_cache is False. Answers that depend on earlier turns of a
+    conversation are never cached; the rest are shared with identical
+    questions asked while they are being generated, unless use_cache is
+    False and the caller asked for a fresh answer.
+    """
+    history = conversation_history(personality_id, session_id)
+    fresh = not use_cache
+    use_cache = use_cache and RESPONSE_CACHE_ENABLED and not history
+    result = lookup_cached_response(personality_id, message) if use_cache else None
+
+    if result is None:
+        if history or fresh:
+            result = answer_personality(personality_id, message, history)
+        else:
+            result = coalesced_requests.do(
+                coalesce_key(personality_id, message),
+                lambda: answer_personality(personality_id, message)
+            )
+
+        if use_cache and 'error' not in result and not result.get('coalesced'):
+            store_cached_response(personality_id, message, result)
+
+    remember_turn(personality_id, session_id, message, result)
+    return result
+
+
+async def aquery_personality(personality_id, message, use_cache=True, session_id=None):
+    """
+    Route a message to the async query for a personality
+
+    The response cache, conversation store and pipeline setup are blocking,
+    so they run in a worker thread; retrieval and generation run on the
+    event loop
+    """
+    history = await asyncio.to_thread(conversation_history, personality_id, session_id)
+    fresh = not use_cache
+    use_cache = use_cache and RESPONSE_CACHE_ENABLED and not history
+    result = None
+    if use_cache:
+        result = await asyncio.to_thread(lookup_cached_response, personality_id, message)
+
+    if result is None:
+        if history or fresh:
+            result = await aanswer_personality(personality_id, message, history)
+        else:
+            result = await coalesced_requests.ado(
+                coalesce_key(personality_id, message),
+                lambda: aanswer_personality(personality_id, message)
+            )
+
+        if use_cache and 'error' not in result and not result.get('coalesced'):
+            await asyncio.to_thread(store_cached_response, personality_id, message, result)
+
+    await asyncio.to_thread(remember_turn, personality_id, session_id, message, result)
+    return result
+
+
+def record_stream(personality_id, message, events, use_cache=True, session_id=None):
+    """
+    Pass stream events through; once the answer is complete, cache it and
+    add it to the session's conversation
+    """
+    sources = []
+    tokens = []
+    for event in events:
+        if event["type"] == "sources":
+            sources = event["sources"]
+        elif event["type"] == "token":
+            tokens.append(event["content"])
+        elif event["type"] == "error":
+            yield event
+            return
+        yield event
+
+    result = {"response": "".join(tokens), "sources": sources}
+    if use_cache:
+        store_cached_response(personality_id, message, result)
+    remember_turn(personality_id, session_id, message, result)
+
+
+def stream_personality(personality_id, message, use_cache=True, session_id=None):
+    """Route a message to the streaming query for a personality"""
+    history = conversation_history(personality_id, session_id)
+    use_cache = use_cache and RESPONSE_CACHE_ENABLED and not history
+    if use_cache:
+        cached = lookup_cached_response(personality_id, message)
+        if cached is not None:
+            events = iter([
+                {"type": "sources", "sources": cached["sources"], "cached": True},
+                {"type": "token", "content": cached["response"]}
+            ])
+            return record_stream(personality_id, message, events, use_cache=False, session_id=session_id)
+
+    personality = get_personality(personality_id)
+
+    if personality['backend'] == 'rag':
+        pipeline = get_pipeline(personality_id)
+        events = pipeline.stream_query(
+            question=message,
+            system_prompt_template=personality['template'],
+            history=history,
+            token_budget=personality['prompt_token_budget']
+        )
+    else:
+        events = stream_with_system_prompt(personality_id, message, history)
+
+    return record_stream(personality_id, message, events, use_cache=use_cache, session_id=session_id)
+
+
+def chat_request_error(data):
+    """
+    Check the body of a single-personality chat request
+
+    Returns:
+        (error message, HTTP status) for an invalid request, else None
+    """
+    if not isinstance(data, dict):
+        return "Request body must be a JSON object", 400
+
+    personality_id = data.get('personality_id')
+    message = data.get('message')
+    if not personality_id or not message:
+        return "Missing personality_id or message", 400
+
+    if not isinstance(personality_id, str) or not isinstance(message, str):
+        return "personality_id and message must be strings", 400
+
+    if not get_personality(personality_id):
+        return "Personality not found", 404
+
+    if personality_id not in AVAILABLE_PERSONALITIES:
+        return "Personality not available", 404
+
+    if data.get('session_id') is not None and not valid_session_id(data['session_id']):
+        return "Invalid session_id", 400
+
+    return None
+
+
+def multi_chat_request_error(data):
+    """
+    Check the body of a multi-personality chat request
+
+    Returns:
+        (error message, HTTP status) for an invalid request, else None
+    """
+    if not isinstance(data, dict):
+        return "Request body must be a JSON object", 400
+
+    message = data.get('message')
+    if not isinstance(message, str) or not message:
+        return "Missing message", 400
+
+    personality_ids = data.get('personality_ids')
+    if personality_ids is not None and not isinstance(personality_ids, list):
+        return "personality_ids must be a list", 400
+    if personality_ids and not all(isinstance(personality_id, str) for personality_id in personality_ids):
+        return "personality_ids must be strings", 400
+
+    if data.get('session_id') is not None and not valid_session_id(data['session_id']):
+        return "Invalid session_id", 400
+
+    return None
+
+
+def upstream_error(personality_id, error):
+    """
+    Map an error that isn't a bug to its HTTP status, recording it
+
+    Returns:
+        (error message, HTTP status, headers) for OpenAI rate limits (429),
+        requests past their deadline (504) and load shedding (503), else None
+    """
+    if isinstance(error, RateLimited):
+        metrics.record_error(personality_id, "rate_limited")
+        return "Too many requests to the model, try again shortly", 429, {"Retry-After": retry_after_header(error)}
+    if isinstance(error, DeadlineExceeded):
+        metrics.record_error(personality_id, "deadline")
+        return "The answer took too long, try again", 504, {}
+    if isinstance(error, Overloaded):
+        metrics.record_error(personality_id, "overloaded")
+        return f"Server busy, try again shortly ({str(error)})", 503, {"Retry-After": "1"}
+    return None
+
+
+def request_deadline():
+    """Seconds the current request may take (clients can ask for less with X-Request-Timeout)"""
+    return deadline_seconds(request.headers.get('X-Request-Timeout'))
+
+
+def sse_event(event):
+    """Encode an event dict as a server-sent event"""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+@app.template_global()
+def avatar(name, alt, size, **attributes):
+    """A persona image, as AVIF/WebP variants with a fallback once assets are built"""
+    return picture(
+        asset_manifest, lambda filename: url_for('static', filename=filename), name, alt, size, **attributes
+    )
+
+
+@app.after_request
+def cache_fingerprinted_assets(response):
+    """Let browsers keep built assets for good: a new build gives them new names"""
+    if request.endpoint == 'static' and response.status_code == 200 \
+            and is_fingerprinted((request.view_args or {}).get('filename', '')):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSET_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def cached_page(name, template, **context):
+    """
+    Serve a page that is the same for every request from the page cache,
+    compressed as the client accepts and revalidated by ETag
+    """
+    def render():
+        return render_template(template, **context)
+
+    page = page_cache.get(name, render) if PAGE_CACHE_ENABLED else CompressedPage(render())
+    encoding, body = page.negotiate(request.accept_encodings)
+    response = app.response_class(body, mimetype='text/html')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Each encoding is a different representation, so it gets its own ETag
+    response.set_etag(f"{page.etag}-{encoding}" if encoding else page.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
 @app.route('/')
 def landing():
     """Landing page"""
-    return render_template('landing.html')
+    return cached_page('landing', 'landing.html')
 
 
 @app.route('/select')
 def select():
     """Personality selection page"""
-    # Get only the 3 available personalities
-    available_ids = ["steve_jobs", "kobe_bryant", "marcus_aurelius"]
-    personalities = []
-    for p_id in available_ids:
-        p_data = PERSONALITIES[p_id]
-        personalities.append({
-            "id": p_id,
-            "name": p_data["name"],
-            "domain": p_data["domain"],
-            "quote": p_data["quote"],
-            "accent_color": p_data["accent_color"],
-            "available": True
-        })
-    return render_template('select.html', personalities=personalities)
+    return cached_page('select', 'select.html', personalities=SELECT_PERSONALITIES)
+
+
+@app.route('/api/personalities')
+def api_personalities():
+    """The personalities that can be chatted with, revalidated by ETag"""
+    response = app.response_class(PERSONALITY_LISTING, mimetype='application/json')
+    response.set_etag(PERSONALITY_LISTING_ETAG)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
 
 
 @app.route('/chat')
 def chat():
     """Multi-column chat interface (3 personalities at once)"""
-    return render_template('chat.html')
+    return cached_page('chat', 'chat.html')
 
 
 @app.route('/api/chat', methods=['POST'])
 def api_chat():
     """API endpoint to send a message and get a response from a personality"""
     data = request.json
-    personality_id = data.get('personality_id')
-    message = data.get('message')
+    error = chat_request_error(data)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
 
-    if not personality_id or not message:
-        return jsonify({"error": "Missing personality_id or message"}), 400
+    personality_id = data['personality_id']
+    message = data['message']
+    use_cache = not data.get('bypass_cache', False)
+    # Pass the returned session_id back to continue the conversation
+    session_id = request_session_id(data)
 
-    # Get personality config
-    personality = get_personality(personality_id)
-    if not personality:
-        return jsonify({"error": "Personality not found"}), 404
+    with metrics.collect_timings() as timings:
+        with metrics.stage(personality_id, "total"), deadline_scope(request_deadline()):
+            try:
+                result = query_personality(personality_id, message, use_cache=use_cache, session_id=session_id)
+
+                # Check if there was an error
+                if 'error' in result:
+                    metrics.record_error(personality_id, "query")
+                    response = make_response(jsonify({"error": result['error']}), 500)
+                else:
+                    response = jsonify({
+                        "response": result['response'],
+                        "sources": result.get('sources', []),
+                        "cached": result.get('cached', False),
+                        "prompt_tokens": result.get('prompt_tokens'),
+                        "session_id": session_id
+                    })
 
+            except Exception as e:
+                mapped = upstream_error(personality_id, e)
+                if mapped:
+                    response = make_response(jsonify({"error": mapped[0]}), mapped[1], mapped[2])
+                else:
+                    print(f"Error in chat: {str(e)}")
+                    import traceback
+                    traceback.print_exc()
+                    metrics.record_error(personality_id, "exception")
+                    response = make_response(jsonify({"error": f"An error occurred: {str(e)}"}), 500)
+
+    # Per-stage timings are opt-in, requested with an X-Request-Timing: 1 header
+    if request.headers.get('X-Request-Timing') == '1':
+        response.headers['Server-Timing'] = metrics.server_timing_header(timings)
+    return response
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+def api_chat_stream():
+    """
+    API endpoint that streams a personality's response as server-sent events
+
+    Emits a 'sources' event first, then 'token' events as the answer is
+    generated, and finally a 'done' event (or an 'error' event on failure,
+    with the HTTP status the error would have had as 'status')
+    """
+    data = request.json
+    error = chat_request_error(data)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+
+    personality_id = data['personality_id']
+    message = data['message']
+    use_cache = not data.get('bypass_cache', False)
+    session_id = request_session_id(data)
+    deadline = request_deadline()
+
+    def generate():
+        try:
+            with deadline_scope(deadline):
+                for event in stream_personality(personality_id, message, use_cache=use_cache, session_id=session_id):
+                    yield sse_event(event)
+            yield sse_event({"type": "done", "session_id": session_id})
+        except Exception as e:
+            yield sse_event(stream_error_event(personality_id, e))
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers=event_stream_headers(session_id)
+    )
+
+
+def stream_error_event(personality_id, error):
+    """The 'error' event ending a stream that failed"""
+    mapped = upstream_error(personality_id, error)
+    if mapped:
+        return {"type": "error", "error": mapped[0], "status": mapped[1]}
+    print(f"Error in chat stream for {personality_id}: {str(error)}")
+    metrics.record_error(personality_id, "stream")
+    import traceback
+    traceback.print_exc()
+    return {"type": "error", "error": f"An error occurred: {str(error)}", "status": 500}
+
+
+def fan_out_events(personality_ids, message, use_cache=True, session_id=None):
+    """
+    Stream several personalities concurrently on the shared worker pool
+
+    Yields each personality's stream events tagged with its personality_id,
+    interleaved in the order they are produced, so a slow personality never
+    holds back the others
+    """
+    events = queue.Queue()
+    cancelled = threading.Event()
+
+    def run(personality_id):
+        try:
+            for event in stream_personality(personality_id, message, use_cache=use_cache, session_id=session_id):
+                if cancelled.is_set():
+                    return
+                events.put(dict(event, personality_id=personality_id))
+                if event["type"] == "error":
+                    return
+            events.put({"type": "done", "personality_id": personality_id, "session_id": session_id})
+        except Exception as e:
+            events.put(dict(stream_error_event(personality_id, e), personality_id=personality_id))
+
+    # Each worker runs in a copy of this context, so it keeps the request's deadline
+    for personality_id in personality_ids:
+        multi_chat_executor.submit(contextvars.copy_context().run, run, personality_id)
+
+    remaining = len(personality_ids)
     try:
-        # Handle Steve Jobs with RAG
-        if personality_id == "steve_jobs":
-            pipeline = get_steve_jobs_pipeline()
-            result = pipeline.query(
-                question=message,
-                system_prompt_template=personality['system_prompt']
-            )
-        # Handle Kobe and Marcus with system prompt only
-        elif personality_id in ["kobe_bryant", "marcus_aurelius"]:
-            result = query_with_system_prompt(personality_id, message)
-        else:
-            return jsonify({"error": "Personality not available"}), 404
+        while remaining:
+            event = events.get()
+            if event["type"] in ("done", "error"):
+                remaining -= 1
+            yield event
+    finally:
+        # Stop the workers early if the client went away
+        cancelled.set()
+
+
+@app.route('/api/chat/multi', methods=['POST'])
+def api_chat_multi():
+    """
+    API endpoint that answers one message with several personalities at once
+
+    Expects 'message' and an optional 'personality_ids' list (defaults to all
+    available personalities). With 'stream': true the answers are streamed as
+    server-sent events tagged with personality_id; otherwise the response
+    holds a 'results' object keyed by personality_id. Each personality keeps
+    its own conversation within the session.
+    """
+    data = request.json
+    error = multi_chat_request_error(data)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+
+    message = data['message']
+    personality_ids = data.get('personality_ids') or AVAILABLE_PERSONALITIES
+    use_cache = not data.get('bypass_cache', False)
+    session_id = request_session_id(data)
+
+    # Drop duplicates while keeping the requested order
+    personality_ids = list(dict.fromkeys(personality_ids))
+    for personality_id in personality_ids:
+        if personality_id not in AVAILABLE_PERSONALITIES:
+            return jsonify({"error": f"Personality not available: {personality_id}"}), 404
+
+    deadline = request_deadline()
+    if data.get('stream'):
+        def generate():
+            with deadline_scope(deadline):
+                for event in fan_out_events(personality_ids, message, use_cache=use_cache, session_id=session_id):
+                    yield sse_event(event)
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers=event_stream_headers(session_id)
+        )
+
+    with deadline_scope(deadline):
+        futures = {
+            multi_chat_executor.submit(
+                contextvars.copy_context().run, query_personality, personality_id, message, use_cache, session_id
+            ): personality_id
+            for personality_id in personality_ids
+        }
+
+    results = {}
+    for future in as_completed(futures):
+        personality_id = futures[future]
+        try:
+            result = future.result()
+        except Exception as e:
+            mapped = upstream_error(personality_id, e)
+            if mapped:
+                result = {"error": mapped[0], "status": mapped[1]}
+            else:
+                print(f"Error in chat for {personality_id}: {str(e)}")
+                metrics.record_error(personality_id, "exception")
+                result = {"error": f"An error occurred: {str(e)}"}
 
-        # Check if there was an error
         if 'error' in result:
-            return jsonify({"error": result['error']}), 500
+            results[personality_id] = {"error": result['error'], "status": result.get('status', 500)}
+        else:
+            results[personality_id] = {
+                "response": result['response'],
+                "sources": result.get('sources', []),
+                "cached": result.get('cached', False)
+            }
 
-        return jsonify({
-            "response": result['response'],
-            "sources": result.get('sources', [])
-        })
+    return jsonify({"results": results, "session_id": session_id})
 
-    except Exception as e:
-        print(f"Error in chat: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
+@app.route('/healthz')
+def healthz():
+    """Readiness check: 200 once every RAG pipeline is loaded, 503 before"""
+    status = {
+        personality_id: personality_id in pipelines
+        for personality_id in RAG_PERSONALITIES
+    }
+    ready = all(status.values())
+    return jsonify({
+        "status": "ok" if ready else "starting",
+        "pipelines": status
+    }), 200 if ready else 503
+
+
+@app.cli.command("preload")
+def preload_command():
+    """Build or load every personality's index"""
+    errors = preload_pipelines()
+    if errors:
+        raise SystemExit(1)
+    print("All pipelines ready")
+
+
+@app.cli.command("assets")
+def assets_command():
+    """Write fingerprinted images and their WebP/AVIF variants to static/build"""
+    manifest = build_assets(app.static_folder)
+    print(f"Built {len(manifest)} images into {os.path.join(app.static_folder, 'build')}")
+
+
+def prefetch_batch(tasks):
+    """
+    Load the pipelines a batch needs and embed its retrieval questions in
+    one request, so the queries find their embeddings in the cache
+    """
+    questions = []
+    for task in tasks:
+        if get_personality(task['personality_id'])['backend'] == 'rag':
+            get_pipeline(task['personality_id'])
+            questions.append(task['question'])
+    if questions:
+        query_embeddings.embed_documents(list(dict.fromkeys(questions)))
+
+
+def answer_batch_question(personality_id, question):
+    """Answer one batch question, fresh and outside any conversation"""
+    return query_personality(personality_id, question, use_cache=False)
+
+
+@app.cli.command("batch")
+@click.argument("questions", type=click.Path(exists=True, dir_okay=False))
+@click.argument("output", type=click.Path(dir_okay=False))
+@click.option("--personality", "-p", "personality_ids", multiple=True,
+              help="Personality to ask (repeatable); defaults to every enabled one")
+@click.option("--batch-size", default=BATCH_SIZE, show_default=True, help="Questions embedded per request")
+@click.option("--concurrency", default=BATCH_CONCURRENCY, show_default=True, help="LLM calls in flight")
+def batch_command(questions, output, personality_ids, batch_size, concurrency):
+    """Answer the questions in a JSONL file, appending answers to OUTPUT (rerun to resume)"""
+    personality_ids = list(personality_ids) or AVAILABLE_PERSONALITIES
+    try:
+        tasks = read_tasks(questions, personality_ids)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    unknown = sorted({task['personality_id'] for task in tasks} - set(AVAILABLE_PERSONALITIES))
+    if unknown:
+        raise click.ClickException(f"Unknown or disabled personalities: {', '.join(unknown)}")
+
+    runner = BatchRunner(
+        answer_batch_question,
+        prefetch=prefetch_batch,
+        batch_size=batch_size,
+        concurrency=concurrency
+    )
+    stats = runner.run(tasks, output)
+    if stats['errors']:
+        raise SystemExit(1)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for this process"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/cache/stats')
+def api_cache_stats():
+    """Hit/miss counters for the response, retrieval and embedding caches, and conversation counts"""
+    return jsonify({
+        "responses": response_cache.stats(),
+        "retrievals": retrieval_cache.stats(),
+        "embeddings": query_embeddings.stats(),
+        "conversations": conversations.stats()
+    })
 
 
 if __name__ == '__main__':
@@ -0,0 +1,196 @@
+"""
+ASGI entry point for the "What Would They Say?" Advisor
+
+/api/chat is served natively with coroutines, so a single process can hold
+hundreds of chats while they wait on OpenAI; concurrent upstream calls are
+scheduled by utils.scheduler. Every other route is handed to the Flask app on
+a worker thread, streaming responses chunk by chunk so SSE keeps working.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+"""
+
+import io
+import sys
+import json
+import asyncio
+import traceback
+import contextvars
+from app import (
+    app as flask_app, preload_pipelines, chat_request_error, request_session_id, aquery_personality, upstream_error
+)
+from utils.scheduler import deadline_scope, deadline_seconds
+from utils import metrics
+
+
+async def read_body(receive):
+    """Read the full request body"""
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def send_json(send, payload, status=200, headers=None):
+    """Send a complete JSON response"""
+    body = json.dumps(payload).encode("utf-8")
+    response_headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode("latin-1"))
+    ]
+    for name, value in (headers or {}).items():
+        response_headers.append((name.lower().encode("latin-1"), value.encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": response_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def api_chat(scope, receive, send):
+    """Async version of the Flask /api/chat route, with the same responses"""
+    try:
+        data = json.loads(await read_body(receive))
+    except ValueError:
+        await send_json(send, {"error": "Invalid JSON body"}, 400)
+        return
+
+    error = chat_request_error(data)
+    if error:
+        await send_json(send, {"error": error[0]}, error[1])
+        return
+
+    personality_id = data['personality_id']
+    message = data['message']
+    use_cache = not data.get('bypass_cache', False)
+    session_id = request_session_id(data)
+    request_headers = dict(scope.get("headers") or [])
+    timeout = request_headers.get(b"x-request-timeout", b"").decode("latin-1")
+
+    headers = {}
+    with metrics.collect_timings() as timings:
+        with metrics.stage(personality_id, "total"), deadline_scope(deadline_seconds(timeout)):
+            try:
+                result = await aquery_personality(
+                    personality_id, message, use_cache=use_cache, session_id=session_id
+                )
+
+                if 'error' in result:
+                    metrics.record_error(personality_id, "query")
+                    payload, status = {"error": result['error']}, 500
+                else:
+                    payload, status = {
+                        "response": result['response'],
+                        "sources": result.get('sources', []),
+                        "cached": result.get('cached', False),
+                        "prompt_tokens": result.get('prompt_tokens'),
+                        "session_id": session_id
+                    }, 200
+
+            except Exception as e:
+                mapped = upstream_error(personality_id, e)
+                if mapped:
+                    payload, status = {"error": mapped[0]}, mapped[1]
+                    headers.update(mapped[2])
+                else:
+                    print(f"Error in chat: {str(e)}")
+                    traceback.print_exc()
+                    metrics.record_error(personality_id, "exception")
+                    payload, status = {"error": f"An error occurred: {str(e)}"}, 500
+
+    if request_headers.get(b"x-request-timing") == b"1":
+        headers["Server-Timing"] = metrics.server_timing_header(timings)
+    await send_json(send, payload, status, headers)
+
+
+def wsgi_environ(scope, body):
+    """Build a WSGI environ for an ASGI HTTP scope"""
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+    for name, value in scope.get("headers") or []:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def wsgi_bridge(scope, receive, send):
+    """Serve a request with the Flask app on a worker thread"""
+    environ = wsgi_environ(scope, await read_body(receive))
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers
+        ]
+
+    # Every step runs in the same context, which Flask's stream_with_context needs
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+
+    def in_thread(func, *args):
+        return loop.run_in_executor(None, context.run, func, *args)
+
+    body = await in_thread(flask_app, environ, start_response)
+    chunks = iter(body)
+    done = object()
+    try:
+        await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+        # Pull one chunk at a time so streamed (SSE) responses are sent as they are produced
+        while True:
+            chunk = await in_thread(next, chunks, done)
+            if chunk is done:
+                break
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(body, "close"):
+            await in_thread(body.close)
+
+
+async def lifespan(receive, send):
+    """Load every pipeline before accepting requests"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            errors = await asyncio.to_thread(preload_pipelines)
+            if errors:
+                print(f"Some pipelines failed to preload: {', '.join(errors)}")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI application"""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http":
+        if scope["path"] == "/api/chat" and scope["method"] == "POST":
+            await api_chat(scope, receive, send)
+        else:
+            await wsgi_bridge(scope, receive, send)
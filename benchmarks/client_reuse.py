@@ -0,0 +1,69 @@
+"""
+Benchmark: per-request latency of building a ChatOpenAI per call versus
+reusing the shared client from utils.clients, against a local stub server
+
+Run from the repository root:
+    python -m benchmarks.client_reuse --requests 200
+"""
+
+import os
+import time
+import argparse
+import statistics
+from benchmarks.stub_openai import StubOpenAIServer
+
+
+def measure(label, call, requests):
+    """Time each call and print a summary in milliseconds"""
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    summary = {
+        "mean_ms": round(statistics.mean(timings), 3),
+        "p50_ms": round(timings[len(timings) // 2], 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 3)
+    }
+    print(f"{label:>22}: mean {summary['mean_ms']}ms  p50 {summary['p50_ms']}ms  p95 {summary['p95_ms']}ms")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub server latency in seconds")
+    args = parser.parse_args()
+
+    with StubOpenAIServer(latency=args.latency) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ["OPENAI_API_KEY"] = "sk-stub"
+
+        from langchain_openai import ChatOpenAI
+        from utils import clients
+
+        def per_request_client():
+            ChatOpenAI(model="gpt-4o-mini", temperature=0.7).invoke("hi")
+
+        def shared_client():
+            clients.get_chat_model().invoke("hi")
+
+        # Warm up imports and the shared pool
+        per_request_client()
+        shared_client()
+
+        connections = server.connections
+        fresh = measure("new client per request", per_request_client, args.requests)
+        fresh_connections = server.connections - connections
+
+        connections = server.connections
+        shared = measure("shared client", shared_client, args.requests)
+        shared_connections = server.connections - connections
+
+    print(f"TCP connections opened: {fresh_connections} per-request vs {shared_connections} shared")
+    print(f"Saved per request: {round(fresh['mean_ms'] - shared['mean_ms'], 3)}ms (mean)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Import-time budget check for the app
+
+Imports a module (default: app) in fresh interpreters with
+`python -X importtime`, and fails when:
+
+    - the median import time is over budget, or
+    - a module that should only load on a cold index or first LLM call
+      (OpenAI SDK, Chroma, pypdf, unused chains, ...) is imported up front
+
+so startup regressions are caught before they slow down worker boot.
+
+Run from the repository root:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget-ms 800 --top 20
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+
+# Imported lazily by the code paths that need them
+DEFERRED_MODULES = (
+    "openai",
+    "langchain_openai",
+    "chromadb",
+    "langchain_community.vectorstores",
+    "pypdf",
+    "langchain_community.document_loaders",
+    "langchain.chains",
+    "langchain.memory",
+    "httpx",
+)
+
+
+def measure(module):
+    """
+    Import a module in a fresh interpreter
+
+    Returns:
+        list of (name, self_us, cumulative_us, depth) in import order
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def import_report(module, runs):
+    """
+    Time importing a module in `runs` fresh interpreters
+
+    Returns:
+        (median ms, ms of every run, imports of the median run, deferred
+        modules that were imported anyway)
+    """
+    measured = [measure(module) for _ in range(runs)]
+    totals = []
+    for imports in measured:
+        top_level = [entry for entry in imports if entry[0] == module]
+        totals.append(top_level[-1][2] / 1000 if top_level else 0.0)
+    total_ms = statistics.median(totals)
+    median_run = measured[totals.index(sorted(totals)[len(totals) // 2])]
+
+    imported = {entry[0] for entry in median_run}
+    eager = [
+        name for name in DEFERRED_MODULES
+        if any(entry == name or entry.startswith(name + ".") for entry in imported)
+    ]
+    return total_ms, totals, median_run, eager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the app's import time against a budget")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15, help="Slowest direct imports to list")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    total_ms, totals, median_run, eager = import_report(args.module, args.runs)
+
+    # Slowest imports of the median run, one or two levels below the module
+    slowest = sorted(
+        (entry for entry in median_run if 1 <= entry[3] <= 2),
+        key=lambda entry: entry[2],
+        reverse=True
+    )[:args.top]
+
+    print(f"import {args.module}: median {total_ms:.1f}ms over {args.runs} runs "
+          f"(min {min(totals):.1f}ms, max {max(totals):.1f}ms), budget {args.budget_ms:.0f}ms")
+    print("\nSlowest imports:")
+    for name, self_us, cumulative_us, depth in slowest:
+        print(f"  {cumulative_us / 1000:8.1f}ms  {'  ' * (depth - 1)}{name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f}ms is over the {args.budget_ms:.0f}ms budget")
+    if eager:
+        failures.append(f"imported at startup but should be deferred: {', '.join(eager)}")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "module": args.module,
+        "median_ms": round(total_ms, 1),
+        "runs_ms": [round(total, 1) for total in totals],
+        "budget_ms": args.budget_ms,
+        "slowest": [
+            {"module": name, "cumulative_ms": round(cumulative_us / 1000, 1)}
+            for name, _, cumulative_us, _ in slowest
+        ],
+        "eager_deferred_modules": eager
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-import-time.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
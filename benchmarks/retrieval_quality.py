@@ -0,0 +1,177 @@
+"""
+Retrieval-quality benchmark for chunking strategies over the bundled PDF
+
+Chunks the Stanford commencement speech with each strategy and asks a set
+of questions whose answer is a known passage of the speech. Reports, per
+strategy:
+
+    - chunks and tokens stored (what gets embedded)
+    - recall@k: questions whose answer passage is in the top k chunks
+    - MRR: mean reciprocal rank of the first chunk holding the answer
+    - context tokens: mean tokens of the top k chunks (what goes in the prompt)
+
+Retrieval is BM25 by default, so the benchmark runs offline and gives the
+same numbers every time. --dense ranks with OpenAI embeddings instead
+(needs OPENAI_API_KEY).
+
+Run from the repository root:
+    python -m benchmarks.retrieval_quality
+    python -m benchmarks.retrieval_quality --k 3 --dense
+"""
+
+import os
+import re
+import json
+import time
+import argparse
+import tempfile
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+PDF_PATH = "steve_job_pdf.pdf"
+
+# (question, passage from the speech that answers it)
+QUESTIONS = [
+    ("Why did you drop out of college?", "I couldn't see the value in it"),
+    ("How did you afford food after dropping out?", "returned Coke bottles"),
+    ("Where did you get a good meal every week?", "Hare Krishna temple"),
+    ("What did you learn in the calligraphy class?", "I learned about serif and sans"),
+    ("How did calligraphy end up in the Macintosh?", "first computer with beautiful typography"),
+    ("What does connecting the dots mean?", "connect them looking backwards"),
+    ("What should I trust in?", "your gut, destiny, life, karma"),
+    ("Where did Apple start?", "in my parents' garage"),
+    ("How did it feel to be fired from Apple?", "very publicly out"),
+    ("Who did you apologize to after getting fired?", "David Packard and Bob Noyce"),
+    ("What good came out of getting fired?", "lightness of being a beginner"),
+    ("What companies did you start after leaving Apple?", "a company named NeXT"),
+    ("How do I find work I love?", "keep looking—and don't settle"),
+    ("What question did you ask yourself in the mirror?", "If today were the last day of my life"),
+    ("Why does remembering death help with decisions?", "the most important tool I've ever encountered"),
+    ("What did the doctors say about your cancer?", "expect to live no longer than three to six months"),
+    ("What happened at the biopsy?", "curable with surgery"),
+    ("Why is death the best invention of life?", "Death is very likely the single best invention of Life"),
+    ("How should I spend my limited time?", "don't waste it living someone else's life"),
+    ("What was the Whole Earth Catalog?", "Google in paperback form"),
+    ("Where does stay hungry stay foolish come from?", "farewell message as they signed off"),
+]
+
+# name -> (chunker, size, overlap); sizes are characters for recursive, tokens for sentence
+STRATEGIES = {
+    "recursive_1000c_200c": ("recursive", 1000, 200),
+    "sentence_300t": ("sentence", 300, 0),
+    "sentence_300t_40t": ("sentence", 300, 40),
+    "sentence_200t": ("sentence", 200, 0),
+}
+
+
+def normalize(text):
+    text = text.replace("’", "'").replace("‘", "'").replace("“", '"').replace("”", '"')
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def build_chunks(documents, chunker, size, overlap):
+    """Chunk documents the way RAGPipeline.split_documents does"""
+    from utils.tokens import count_tokens
+    if chunker == "sentence":
+        from utils.chunking import split_documents
+        return split_documents(documents, size, overlap)
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    chunks = RecursiveCharacterTextSplitter(
+        chunk_size=size, chunk_overlap=overlap, length_function=len
+    ).split_documents(documents)
+    for chunk in chunks:
+        chunk.metadata["token_count"] = count_tokens(chunk.page_content)
+    return chunks
+
+
+def lexical_ranker(chunks):
+    from utils.hybrid import BM25Index
+    index = BM25Index(chunks)
+    return lambda question, k: [document for document, _ in index.search(question, k)[0]]
+
+
+def dense_ranker(chunks, workdir):
+    from utils.clients import get_embeddings
+    from utils.numpy_store import NumpyVectorStore
+    store = NumpyVectorStore(get_embeddings(), workdir)
+    store.add_texts([chunk.page_content for chunk in chunks], [chunk.metadata for chunk in chunks])
+    return lambda question, k: store.similarity_search(question, k=k)
+
+
+def evaluate(chunks, rank, k):
+    hits = 0
+    reciprocal_ranks = []
+    context_tokens = []
+    misses = []
+    for question, answer in QUESTIONS:
+        results = rank(question, k)
+        context_tokens.append(sum(document.metadata.get("token_count", 0) for document in results))
+        position = next(
+            (i for i, document in enumerate(results, start=1) if normalize(answer) in normalize(document.page_content)),
+            None
+        )
+        if position is None:
+            reciprocal_ranks.append(0.0)
+            misses.append(question)
+        else:
+            hits += 1
+            reciprocal_ranks.append(1.0 / position)
+
+    return {
+        "chunks": len(chunks),
+        "tokens_indexed": sum(chunk.metadata["token_count"] for chunk in chunks),
+        "mean_chunk_tokens": round(sum(chunk.metadata["token_count"] for chunk in chunks) / len(chunks), 1),
+        f"recall_at_{k}": round(hits / len(QUESTIONS), 3),
+        "mrr": round(sum(reciprocal_ranks) / len(QUESTIONS), 3),
+        "mean_context_tokens": round(sum(context_tokens) / len(context_tokens), 1),
+        "misses": misses
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chunking strategies on retrieval quality")
+    parser.add_argument("--k", type=int, default=4, help="Chunks retrieved per question")
+    parser.add_argument("--dense", action="store_true", help="Rank with OpenAI embeddings instead of BM25")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    from utils.corpus import load_file
+    from utils.tokens import tokenizer_name
+    documents = load_file(PDF_PATH)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="wwts-retrieval-") as workdir:
+        for name, (chunker, size, overlap) in STRATEGIES.items():
+            chunks = build_chunks(documents, chunker, size, overlap)
+            if args.dense:
+                rank = dense_ranker(chunks, os.path.join(workdir, name))
+            else:
+                rank = lexical_ranker(chunks)
+            results[name] = evaluate(chunks, rank, args.k)
+
+    recall = f"recall_at_{args.k}"
+    print(f"\n{len(QUESTIONS)} questions, k={args.k}, {'dense' if args.dense else 'BM25'} retrieval, "
+          f"tokenizer {tokenizer_name()}\n")
+    print(f"{'strategy':>22}  {'chunks':>6}  {'tokens':>6}  {recall:>11}  {'mrr':>5}  {'context tok':>11}")
+    for name, metrics in results.items():
+        print(f"{name:>22}  {metrics['chunks']:>6}  {metrics['tokens_indexed']:>6}  "
+              f"{metrics[recall]:>11}  {metrics['mrr']:>5}  {metrics['mean_context_tokens']:>11}")
+        for question in metrics["misses"]:
+            print(f"{'':>24}missed: {question}")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "retrieval": "dense" if args.dense else "bm25",
+        "tokenizer": tokenizer_name(),
+        "k": args.k,
+        "results": results
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-retrieval-quality.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
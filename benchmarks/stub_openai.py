@@ -0,0 +1,152 @@
+"""
+Local stand-in for the OpenAI API, for benchmarks that must not hit the network
+
+Serves /v1/chat/completions and /v1/embeddings with canned responses over
+HTTP/1.1 keep-alive, with optional per-request latency and simulated 429s.
+"""
+
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubOpenAIServer:
+    """
+    Runs the stub API on a background thread
+
+    Usage:
+        with StubOpenAIServer(latency=0.05) as server:
+            os.environ["OPENAI_BASE_URL"] = server.base_url
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, rate_limit_ratio=0.0,
+                 answer="Stay hungry, stay foolish.", embedding_size=64):
+        """
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free one)
+            latency: Seconds each request takes
+            rate_limit_ratio: Fraction of requests answered with a 429
+            answer: Content of every chat completion
+            embedding_size: Dimension of the returned embeddings
+        """
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.answer = answer
+        self.embedding_size = embedding_size
+        self.requests = 0
+        self.rate_limited = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Buffer each response and send it in one write, so localhost
+            # round trips are not stretched by Nagle/delayed-ACK stalls
+            wbufsize = -1
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, payload, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+
+                with server._lock:
+                    server.requests += 1
+                    limited = random.random() < server.rate_limit_ratio
+                    if limited:
+                        server.rate_limited += 1
+
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if limited:
+                    self._reply(429, {"error": {
+                        "message": "Rate limit reached (stub)",
+                        "type": "rate_limit_error",
+                        "code": "rate_limit_exceeded"
+                    }}, headers={"retry-after-ms": "10"})
+                elif self.path.endswith("/chat/completions"):
+                    self._reply(200, server.chat_completion(request))
+                elif self.path.endswith("/embeddings"):
+                    self._reply(200, server.embeddings(request))
+                else:
+                    self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        return Handler
+
+    def chat_completion(self, request):
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.answer},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 8, "total_tokens": 18}
+        }
+
+    def embeddings(self, request):
+        inputs = request.get("input", [])
+        if isinstance(inputs, (str, int)) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        data = []
+        for i, text in enumerate(inputs):
+            seed = hashlib.sha256(str(text).encode("utf-8")).digest()
+            vector = [(seed[j % len(seed)] - 128) / 128 for j in range(self.embedding_size)]
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        return {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "stub"),
+            "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
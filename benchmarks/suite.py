@@ -0,0 +1,250 @@
+"""
+Offline end-to-end benchmark suite
+
+Runs the app's hot paths against deterministic fake chat and embedding
+models with configurable latency, so results are reproducible and free:
+
+    - RAGPipeline.setup, cold (empty vector store) and warm (existing store)
+    - RAGPipeline.query
+    - query_with_system_prompt
+    - the Flask /api/chat route under concurrent load
+
+Reports p50/p95/p99 latency, requests per second and peak RSS, and saves
+them as JSON so runs can be compared between commits.
+
+Run from the repository root:
+    python -m benchmarks.suite
+    python -m benchmarks.suite --compare benchmarks/results/<earlier run>.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(timings, wall_seconds):
+    """Latency percentiles (ms) and throughput for a list of durations (s)"""
+    timings = sorted(t * 1000 for t in timings)
+    return {
+        "requests": len(timings),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(sum(timings) / len(timings), 3) if timings else 0.0,
+        "rps": round(len(timings) / wall_seconds, 1) if wall_seconds > 0 else 0.0,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def run_sequential(call, iterations):
+    """Time a callable run back to back"""
+    timings = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        call_start = time.perf_counter()
+        call(i)
+        timings.append(time.perf_counter() - call_start)
+    return summarize(timings, time.perf_counter() - start)
+
+
+def run_concurrent(call, iterations, concurrency):
+    """Time a callable run from a pool of concurrent clients"""
+    timings = []
+    lock = threading.Lock()
+
+    def timed(i):
+        call_start = time.perf_counter()
+        call(i)
+        elapsed = time.perf_counter() - call_start
+        with lock:
+            timings.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed, range(iterations)))
+    return summarize(timings, time.perf_counter() - start)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_suite(args, workdir):
+    # Configure the app before it is imported
+    os.environ["VECTOR_STORE_DIR"] = os.path.join(workdir, "vector_store")
+    os.environ["EMBEDDING_CACHE_DISK"] = "0"
+    # Count tokens without tiktoken's vocabulary, which is downloaded on first use
+    os.environ.setdefault("TOKENIZER", "estimate")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+    from utils import clients
+    from utils.fakes import FakeChatModel, FakeEmbeddings
+    from utils.rag_pipeline import RAGPipeline
+    from utils.embedding_cache import CachedEmbeddings
+    from prompts.registry import get_personality
+
+    clients.override(
+        chat_model=FakeChatModel(latency=args.llm_latency, token_latency=args.token_latency),
+        embeddings=FakeEmbeddings(size=args.embedding_size, latency=args.embed_latency)
+    )
+
+    import app
+
+    template = get_personality("steve_jobs")["template"]
+    results = {}
+
+    # Cold setup: every run builds a fresh store from the PDF
+    def cold_setup(i):
+        RAGPipeline(
+            "steve_jobs", "steve_job_pdf.pdf",
+            persist_directory=os.path.join(workdir, f"cold_{i}"),
+            embeddings=CachedEmbeddings(clients.SharedEmbeddings()),
+            backend=args.backend
+        ).setup()
+
+    # Warm setup: open the store built by the first cold run
+    def warm_setup(i):
+        RAGPipeline(
+            "steve_jobs", "steve_job_pdf.pdf",
+            persist_directory=os.path.join(workdir, "cold_0"),
+            embeddings=CachedEmbeddings(clients.SharedEmbeddings()),
+            backend=args.backend
+        ).setup()
+
+    print("Benchmarking RAGPipeline.setup (cold)...")
+    results["setup_cold"] = run_sequential(cold_setup, args.setup_iterations)
+    print("Benchmarking RAGPipeline.setup (warm)...")
+    results["setup_warm"] = run_sequential(warm_setup, args.setup_iterations)
+
+    pipeline = RAGPipeline(
+        "steve_jobs", "steve_job_pdf.pdf",
+        persist_directory=os.path.join(workdir, "cold_0"),
+        embeddings=CachedEmbeddings(clients.SharedEmbeddings()),
+        backend=args.backend
+    ).setup()
+
+    print("Benchmarking RAGPipeline.query...")
+    results["rag_query"] = run_sequential(
+        lambda i: pipeline.query(f"What would you tell founder number {i}?", template),
+        args.iterations
+    )
+
+    print("Benchmarking query_with_system_prompt...")
+    results["system_prompt_query"] = run_sequential(
+        lambda i: app.query_with_system_prompt("kobe_bryant", f"How do I train harder, take {i}?"),
+        args.iterations
+    )
+
+    personality_ids = ["steve_jobs", "kobe_bryant", "marcus_aurelius"]
+
+    def api_chat(i):
+        response = app.app.test_client().post("/api/chat", json={
+            "personality_id": personality_ids[i % len(personality_ids)],
+            "message": f"Give me advice number {i}",
+            "bypass_cache": True
+        })
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/chat returned {response.status_code}: {response.get_data(as_text=True)}")
+
+    app.preload_pipelines()
+    print(f"Benchmarking /api/chat with {args.concurrency} concurrent clients...")
+    results["api_chat"] = run_concurrent(api_chat, args.requests, args.concurrency)
+
+    clients.override()
+    return results
+
+
+def compare(current, baseline):
+    """Print the change of every latency/throughput metric against a baseline run"""
+    print(f"\nCompared with {baseline.get('commit', '?')}:")
+    for name, metrics in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old:
+            continue
+        changes = []
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "rps"):
+            if old.get(metric):
+                delta = (metrics[metric] - old[metric]) / old[metric] * 100
+                changes.append(f"{metric} {delta:+.1f}%")
+        print(f"  {name:>20}: " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency/throughput benchmarks")
+    parser.add_argument("--iterations", type=int, default=50, help="Sequential queries per scenario")
+    parser.add_argument("--setup-iterations", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=200, help="Total /api/chat requests")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake LLM time to first token (s)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Fake LLM delay per token (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="Fake embeddings request latency (s)")
+    parser.add_argument("--embedding-size", type=int, default=256)
+    parser.add_argument("--backend", default=None, help="Vector store backend (chroma or numpy)")
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="wwts-bench-")
+    try:
+        results = run_suite(args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results
+    }
+
+    print()
+    for name, metrics in results.items():
+        print(f"{name:>20}: p50 {metrics['p50_ms']}ms  p95 {metrics['p95_ms']}ms  "
+              f"p99 {metrics['p99_ms']}ms  {metrics['rps']} req/s  peak RSS {metrics['peak_rss_mb']}MB")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
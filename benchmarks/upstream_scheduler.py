@@ -0,0 +1,231 @@
+"""
+Upstream scheduling against a slow, rate limiting OpenAI stub
+
+Sends /api/chat requests through the Flask app to the local OpenAI stub
+(embeddings are faked in-process) and checks what utils.scheduler does:
+
+    - coalescing: concurrent identical questions make one upstream call
+      between them; the same number of distinct questions make one each
+    - rate limits: 429s that outlast the scheduler's retries come back as
+      429s with a Retry-After header, never as 500s
+    - deadlines: with a slow upstream, requests asking for a short
+      X-Request-Timeout get a 504 about when they asked for it; async
+      queries are cancelled at the deadline itself
+    - pacing: with UPSTREAM_RATE set, calls are spread out to that rate
+
+Run from the repository root:
+    python -m benchmarks.upstream_scheduler
+    python -m benchmarks.upstream_scheduler --latency 0.5 --concurrency 32
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_openai import StubOpenAIServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+PERSONALITY_ID = "steve_jobs"
+
+
+def post_chats(client_app, messages, concurrency, headers=None):
+    """POST each message to /api/chat concurrently; returns (status, Retry-After, seconds) per message"""
+    def send(message):
+        start = time.perf_counter()
+        response = client_app.test_client().post("/api/chat", json={
+            "personality_id": PERSONALITY_ID,
+            "message": message,
+            "bypass_cache": True
+        }, headers=headers or {})
+        return response.status_code, response.headers.get("Retry-After"), time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(send, messages))
+
+
+def upstream_calls(stub, run):
+    """Run something and count the chat requests the stub received meanwhile"""
+    before = stub.requests
+    result = run()
+    return result, stub.requests - before
+
+
+def coalescing(app, stub, requests):
+    # All at once, so every identical question arrives while the first is in flight
+    identical, identical_calls = upstream_calls(
+        stub, lambda: post_chats(app, ["How do I find what I love?"] * requests, requests)
+    )
+    distinct, distinct_calls = upstream_calls(
+        stub, lambda: post_chats(app, [f"How do I find what I love? ({i})" for i in range(requests)], requests)
+    )
+    return {
+        "requests": requests,
+        "identical": {"statuses": dict(Counter(r[0] for r in identical)), "upstream_calls": identical_calls},
+        "distinct": {"statuses": dict(Counter(r[0] for r in distinct)), "upstream_calls": distinct_calls}
+    }
+
+
+def rate_limits(app, stub, requests, concurrency, ratio):
+    stub.rate_limit_ratio = ratio
+    try:
+        results, calls = upstream_calls(
+            stub, lambda: post_chats(app, [f"What should I do with my life? ({i})" for i in range(requests)], concurrency)
+        )
+    finally:
+        stub.rate_limit_ratio = 0.0
+    return {
+        "requests": requests,
+        "stub_429_ratio": ratio,
+        "upstream_calls": calls,
+        "statuses": dict(Counter(r[0] for r in results)),
+        "retry_after": sorted({r[1] for r in results if r[0] == 429})
+    }
+
+
+def deadlines(app, stub, requests, concurrency, latency, timeout):
+    from app import aquery_personality
+    from utils.scheduler import deadline_scope, DeadlineExceeded
+
+    stub.latency = latency
+    try:
+        results = post_chats(
+            app, [f"How should I think about failure? ({i})" for i in range(requests)], concurrency,
+            headers={"X-Request-Timeout": str(timeout)}
+        )
+
+        async def ask(i):
+            start = time.perf_counter()
+            with deadline_scope(timeout):
+                try:
+                    await aquery_personality(PERSONALITY_ID, f"What is design? ({i})", use_cache=False)
+                    outcome = "answered"
+                except DeadlineExceeded:
+                    outcome = "deadline"
+            return outcome, time.perf_counter() - start
+
+        async def ask_all():
+            return await asyncio.gather(*(ask(i) for i in range(requests)))
+
+        async_results = asyncio.run(ask_all())
+    finally:
+        stub.latency = 0.0
+
+    return {
+        "requests": requests,
+        "stub_latency_s": latency,
+        "timeout_s": timeout,
+        "sync": {
+            "statuses": dict(Counter(r[0] for r in results)),
+            "max_seconds": round(max(r[2] for r in results), 3)
+        },
+        "async": {
+            "outcomes": dict(Counter(r[0] for r in async_results)),
+            "max_seconds": round(max(r[1] for r in async_results), 3)
+        }
+    }
+
+
+def pacing(app, stub, requests, concurrency, rate, burst):
+    from utils import scheduler
+
+    default_bucket = scheduler.upstream.bucket
+    scheduler.upstream.bucket = scheduler.TokenBucket(rate, burst)
+    # Embeddings are scheduled too, so count every call the bucket paced
+    scheduled = scheduler.upstream.calls
+    try:
+        start = time.perf_counter()
+        results = post_chats(app, [f"What is focus? ({i})" for i in range(requests)], concurrency)
+        seconds = time.perf_counter() - start
+    finally:
+        scheduler.upstream.bucket = default_bucket
+    calls = scheduler.upstream.calls - scheduled
+    return {
+        "requests": requests,
+        "rate": rate,
+        "burst": burst,
+        "statuses": dict(Counter(r[0] for r in results)),
+        "seconds": round(seconds, 3),
+        "upstream_calls": calls,
+        "expected_seconds": round(max(0, calls - burst) / rate, 3),
+        "calls_per_second": round(calls / seconds, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check upstream scheduling against the OpenAI stub")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub latency for the coalescing run")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.6, help="Fraction of stub requests answered 429")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="Stub latency for the deadline run")
+    parser.add_argument("--timeout", type=float, default=0.5, help="X-Request-Timeout for the deadline run")
+    parser.add_argument("--rate", type=float, default=20, help="UPSTREAM_RATE for the pacing run")
+    parser.add_argument("--burst", type=int, default=5)
+    parser.add_argument("--output", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="wwts-scheduler-") as workdir, \
+            StubOpenAIServer(latency=args.latency) as stub:
+        os.environ.update({
+            "OPENAI_API_KEY": "sk-benchmark",
+            "OPENAI_BASE_URL": stub.base_url,
+            "VECTOR_STORE_DIR": os.path.join(workdir, "vector_store"),
+            "VECTOR_BACKEND": "numpy",
+            "CONVERSATION_DIR": ""
+        })
+        # Count tokens without tiktoken's vocabulary, which is downloaded on first use
+        os.environ.setdefault("TOKENIZER", "estimate")
+        from utils import clients
+        from utils.fakes import FakeEmbeddings
+        clients.override(embeddings=FakeEmbeddings())
+
+        from app import app, get_pipeline
+        get_pipeline(PERSONALITY_ID)
+
+        print("Coalescing...")
+        report_coalescing = coalescing(app, stub, args.requests)
+        stub.latency = 0.0
+        print("Rate limits...")
+        report_rate_limits = rate_limits(app, stub, args.requests, args.concurrency, args.rate_limit_ratio)
+        print("Deadlines...")
+        report_deadlines = deadlines(
+            app, stub, min(args.requests, 8), args.concurrency, args.slow_latency, args.timeout
+        )
+        print("Pacing...")
+        report_pacing = pacing(app, stub, args.requests, args.concurrency, args.rate, args.burst)
+
+    print(f"\n{args.requests} identical questions: {report_coalescing['identical']['upstream_calls']} upstream calls "
+          f"{report_coalescing['identical']['statuses']}; distinct: "
+          f"{report_coalescing['distinct']['upstream_calls']} {report_coalescing['distinct']['statuses']}")
+    print(f"Stub answering {args.rate_limit_ratio:.0%} with 429: statuses {report_rate_limits['statuses']}, "
+          f"Retry-After {report_rate_limits['retry_after']}")
+    print(f"Stub taking {args.slow_latency}s, timeout {args.timeout}s: sync {report_deadlines['sync']['statuses']} "
+          f"(slowest {report_deadlines['sync']['max_seconds']}s), async {report_deadlines['async']['outcomes']} "
+          f"(slowest {report_deadlines['async']['max_seconds']}s)")
+    print(f"UPSTREAM_RATE={args.rate} burst {args.burst}: {args.requests} chats ({report_pacing['upstream_calls']} "
+          f"upstream calls) in {report_pacing['seconds']}s "
+          f"(expected {report_pacing['expected_seconds']}s), {report_pacing['calls_per_second']} calls/s")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "coalescing": report_coalescing,
+        "rate_limits": report_rate_limits,
+        "deadlines": report_deadlines,
+        "pacing": report_pacing
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-upstream-scheduler.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Per-worker memory of the gunicorn deployment, with and without preloading
+
+Starts gunicorn (gunicorn.conf.py, app:app) with 1, 4 and 8 workers, once
+with GUNICORN_PRELOAD=1 (indexes loaded in the master, shared copy-on-write)
+and once with GUNICORN_PRELOAD=0 (every worker loads its own). After a few chats per worker it reads each
+process's memory from /proc/<pid>/smaps_rollup:
+
+    - RSS: resident pages, counting shared pages in full for every process
+    - PSS: shared pages divided between the processes sharing them
+    - USS: pages private to the process, freed if it exits
+
+Total PSS (master plus workers) is what the deployment actually costs.
+Chats go to the local OpenAI stub; embeddings are faked in-process, since
+the OpenAI embeddings client needs tiktoken's vocabulary from the network.
+Linux only.
+
+Run from the repository root:
+    python -m benchmarks.worker_memory
+    python -m benchmarks.worker_memory --workers 1 4 --backend chroma
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+import urllib.error
+
+from benchmarks.stub_openai import StubOpenAIServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Serves gunicorn.conf.py with fake embeddings installed in the master
+CONFIG_TEMPLATE = """
+import runpy
+from utils import clients
+from utils.fakes import FakeEmbeddings
+
+clients.override(embeddings=FakeEmbeddings(size={embedding_size}))
+globals().update({{
+    name: value for name, value in runpy.run_path({config!r}).items()
+    if not name.startswith("__")
+}})
+"""
+
+QUESTIONS = [
+    "What did you mean by connecting the dots?",
+    "How do I find what I love?",
+    "What should I do with my life?",
+    "How should I think about failure?",
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def children(pid):
+    """Pids of a process's direct children"""
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name can contain spaces, so split after it
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            found.append(int(entry))
+    return found
+
+
+def memory_mb(pid):
+    """RSS, PSS and USS of a process in MB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": round(values.get("Rss", 0.0), 1),
+        "pss": round(values.get("Pss", 0.0), 1),
+        "uss": round(values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0), 1)
+    }
+
+
+def request(url, payload=None, timeout=10):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def measure(workers, preload, env, config, startup_timeout, chats_per_worker):
+    """Start gunicorn, warm every worker up, and read the memory of each process"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(
+        env,
+        GUNICORN_BIND=f"127.0.0.1:{port}",
+        GUNICORN_WORKERS=str(workers),
+        GUNICORN_PRELOAD="1" if preload else "0"
+    )
+    master = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", config, "app:app"],
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        start = time.perf_counter()
+        deadline = time.monotonic() + startup_timeout
+        while len(children(master.pid)) < workers or request(f"{base_url}/healthz") != 200:
+            if master.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with {master.returncode}")
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"gunicorn not ready after {startup_timeout}s")
+            time.sleep(0.2)
+        ready_seconds = time.perf_counter() - start
+
+        # Touch the retrieval and chat paths on (very likely) every worker
+        for i in range(chats_per_worker * workers):
+            status = request(f"{base_url}/api/chat", {
+                "personality_id": "steve_jobs",
+                "message": QUESTIONS[i % len(QUESTIONS)],
+                "bypass_cache": True
+            })
+            if status != 200:
+                raise RuntimeError(f"/api/chat returned {status}")
+        time.sleep(1)
+
+        master_memory = memory_mb(master.pid)
+        worker_memory = [memory_mb(pid) for pid in children(master.pid)]
+    finally:
+        master.send_signal(signal.SIGTERM)
+        try:
+            master.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            master.kill()
+            master.wait()
+
+    def mean(key):
+        return round(sum(memory[key] for memory in worker_memory) / len(worker_memory), 1)
+
+    return {
+        "workers": workers,
+        "preload": preload,
+        "ready_seconds": round(ready_seconds, 2),
+        "master": master_memory,
+        "worker_rss_mb": mean("rss"),
+        "worker_pss_mb": mean("pss"),
+        "worker_uss_mb": mean("uss"),
+        "total_pss_mb": round(master_memory["pss"] + sum(memory["pss"] for memory in worker_memory), 1),
+        "per_worker": worker_memory
+    }
+
+
+def deployment(workdir, stub, backend, embedding_size):
+    """
+    Environment and gunicorn config for measure(), served by the stub
+
+    Returns:
+        (environment, path of the gunicorn config written to workdir)
+    """
+    config = os.path.join(workdir, "gunicorn.conf.py")
+    with open(config, "w") as f:
+        f.write(CONFIG_TEMPLATE.format(
+            embedding_size=embedding_size,
+            config=os.path.join(REPO_ROOT, "gunicorn.conf.py")
+        ))
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="sk-benchmark",
+        OPENAI_BASE_URL=stub.base_url,
+        VECTOR_STORE_DIR=os.path.join(workdir, "vector_store"),
+        VECTOR_BACKEND=backend,
+        CONVERSATION_DIR="",
+        # Count tokens without tiktoken's vocabulary, which is downloaded on first use
+        TOKENIZER=os.environ.get("TOKENIZER", "estimate"),
+        PYTHONPATH=REPO_ROOT,
+        PYTHONUNBUFFERED="1"
+    )
+    return env, config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure gunicorn worker memory with and without preloading")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--backend", default="numpy", help="Vector store backend (chroma or numpy)")
+    parser.add_argument("--embedding-size", type=int, default=1536)
+    parser.add_argument("--chats-per-worker", type=int, default=4)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--output", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="wwts-workers-") as workdir, \
+            StubOpenAIServer() as stub:
+        env, config = deployment(workdir, stub, args.backend, args.embedding_size)
+        for preload in (False, True):
+            for workers in args.workers:
+                print(f"Starting {workers} worker(s), preload {'on' if preload else 'off'}...")
+                runs.append(measure(workers, preload, env, config, args.startup_timeout, args.chats_per_worker))
+
+    print(f"\n{'workers':>7}  {'preload':>7}  {'ready s':>7}  {'worker RSS':>10}  {'worker PSS':>10}  "
+          f"{'worker USS':>10}  {'total PSS':>9}")
+    for run in runs:
+        print(f"{run['workers']:>7}  {'on' if run['preload'] else 'off':>7}  {run['ready_seconds']:>7}  "
+              f"{run['worker_rss_mb']:>8}MB  {run['worker_pss_mb']:>8}MB  {run['worker_uss_mb']:>8}MB  "
+              f"{run['total_pss_mb']:>7}MB")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "backend": args.backend,
+        "runs": runs
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-worker-memory.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
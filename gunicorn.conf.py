@@ -0,0 +1,51 @@
+"""
+Gunicorn configuration: load indexes before workers start serving
+
+By default the app is imported, and every personality's index loaded, once
+in the master, and workers are forked from it, sharing that memory
+copy-on-write (Chroma indexes can't be shared this way, so with that
+backend each worker still opens its own). With GUNICORN_PRELOAD=0 the
+master only builds the indexes on disk and each worker loads everything.
+
+Run with:
+    gunicorn app:app
+"""
+
+import gc
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+
+def on_starting(server):
+    """Build (or, when preloading, load) every personality's index once, in the master"""
+    import app
+
+    if preload_app:
+        server.log.info("Loading personality indexes in the master...")
+        errors = app.preload_for_fork()
+        if errors:
+            server.log.warning(f"Some indexes failed to load: {errors}")
+        # Everything loaded so far lives as long as the workers; keep the
+        # garbage collector from writing to (and so copying) those pages
+        gc.freeze()
+        return
+
+    server.log.info("Building personality indexes...")
+    errors = app.build_indexes()
+    if errors:
+        server.log.warning(f"Some indexes failed to build: {errors}")
+
+
+def post_fork(server, worker):
+    """Get each worker's pipelines ready before it accepts traffic"""
+    import app
+
+    app.reopen_after_fork()
+    # Opens the prebuilt indexes not already loaded in the master
+    errors = app.preload_pipelines()
+    if errors:
+        server.log.warning(f"Worker {worker.pid} failed to load: {errors}")
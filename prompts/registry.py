@@ -0,0 +1,160 @@
+"""
+Personality registry, validated and compiled once at import
+
+Every personality's system prompt is parsed into a PromptTemplate up front,
+so a malformed prompt fails at startup instead of on someone's question,
+and each request only has to join pre-split text. The payloads for the
+selection page and the personality listing API are built here too, since
+they never change while the process runs.
+"""
+
+import json
+import hashlib
+from string import Formatter
+from prompts.personalities import PERSONALITIES
+from utils.corpus import has_corpus
+from utils.context import PROMPT_TOKEN_BUDGET
+from utils.tokens import count_tokens
+
+BACKENDS = ("rag", "prompt")
+
+REQUIRED_FIELDS = ("id", "name", "domain", "quote", "accent_color", "system_prompt", "enabled", "backend")
+
+# Order personalities are listed and answered in; any others follow in the
+# order prompts/personalities.py defines them
+DISPLAY_ORDER = ("steve_jobs", "kobe_bryant", "marcus_aurelius")
+
+
+class PromptTemplate:
+    """
+    A system prompt split once into literal text and {context}/{question} slots
+
+    Drop-in for the prompt string: format(context=..., question=...) returns
+    the same text as str.format would.
+    """
+
+    FIELDS = ("context", "question")
+
+    def __init__(self, template):
+        self.template = template
+        self.parts = []
+        seen = set()
+        for literal, field, spec, conversion in Formatter().parse(template):
+            if field is not None:
+                if field not in self.FIELDS:
+                    raise ValueError(f"Unknown placeholder {{{field}}}")
+                if spec or conversion:
+                    raise ValueError(f"Placeholder {{{field}}} can't have a format spec or conversion")
+                seen.add(field)
+            self.parts.append((literal, field))
+
+        missing = [field for field in self.FIELDS if field not in seen]
+        if missing:
+            raise ValueError(f"Missing placeholder(s): {', '.join(missing)}")
+        self._token_count = None
+
+    @property
+    def token_count(self):
+        """Tokens in the literal text, counted on first use"""
+        if self._token_count is None:
+            self._token_count = sum(count_tokens(literal) for literal, _ in self.parts)
+        return self._token_count
+
+    def format(self, context, question):
+        values = {"context": str(context), "question": str(question)}
+        return "".join(
+            literal + values[field] if field else literal
+            for literal, field in self.parts
+        )
+
+
+def compile_personality(personality_id, personality):
+    """Validate a personality config and compile its system prompt"""
+    missing = [field for field in REQUIRED_FIELDS if field not in personality]
+    if missing:
+        raise ValueError(f"Personality {personality_id} is missing {', '.join(missing)}")
+    if personality["id"] != personality_id:
+        raise ValueError(f"Personality {personality_id} has id {personality['id']}")
+    if personality["backend"] not in BACKENDS:
+        raise ValueError(f"Personality {personality_id} has unknown backend {personality['backend']}")
+
+    budget = personality.get("prompt_token_budget", PROMPT_TOKEN_BUDGET)
+    if not isinstance(budget, int) or budget <= 0:
+        raise ValueError(f"Personality {personality_id} has invalid prompt_token_budget {budget!r}")
+
+    try:
+        template = PromptTemplate(personality["system_prompt"])
+    except ValueError as e:
+        raise ValueError(f"Invalid system_prompt for {personality_id}: {str(e)}")
+
+    backend = personality["backend"]
+    if backend == "rag" and personality["enabled"] and not has_corpus(personality_id):
+        # Falls back until documents are added to its corpus
+        print(f"No source documents for {personality_id}, answering from its system prompt")
+        backend = "prompt"
+
+    return dict(personality, template=template, backend=backend, prompt_token_budget=budget)
+
+
+REGISTRY = {
+    personality_id: compile_personality(personality_id, personality)
+    for personality_id, personality in PERSONALITIES.items()
+}
+
+for personality_id in DISPLAY_ORDER:
+    if personality_id not in REGISTRY:
+        raise ValueError(f"DISPLAY_ORDER lists unknown personality {personality_id}")
+
+
+def display_position(personality_id):
+    """Sort key placing a personality by DISPLAY_ORDER, then by definition order"""
+    if personality_id in DISPLAY_ORDER:
+        return DISPLAY_ORDER.index(personality_id), 0
+    return len(DISPLAY_ORDER), list(REGISTRY).index(personality_id)
+
+
+# Personalities that can be chatted with, in display order
+ENABLED_PERSONALITIES = sorted(
+    (personality_id for personality_id, personality in REGISTRY.items() if personality["enabled"]),
+    key=display_position
+)
+
+# Enabled personalities answered from their corpus
+RAG_PERSONALITIES = [
+    personality_id for personality_id in ENABLED_PERSONALITIES
+    if REGISTRY[personality_id]["backend"] == "rag"
+]
+
+# Template context for the selection page
+SELECT_PERSONALITIES = [
+    {
+        "id": personality_id,
+        "name": REGISTRY[personality_id]["name"],
+        "domain": REGISTRY[personality_id]["domain"],
+        "quote": REGISTRY[personality_id]["quote"],
+        "accent_color": REGISTRY[personality_id]["accent_color"],
+        "available": True
+    }
+    for personality_id in ENABLED_PERSONALITIES
+]
+
+# Body and ETag of the personality listing API
+PERSONALITY_LISTING = json.dumps({
+    "personalities": [
+        {
+            "id": personality_id,
+            "name": REGISTRY[personality_id]["name"],
+            "domain": REGISTRY[personality_id]["domain"],
+            "quote": REGISTRY[personality_id]["quote"],
+            "accent_color": REGISTRY[personality_id]["accent_color"],
+            "suggested_prompts": REGISTRY[personality_id].get("suggested_prompts", [])
+        }
+        for personality_id in ENABLED_PERSONALITIES
+    ]
+}).encode("utf-8")
+PERSONALITY_LISTING_ETAG = hashlib.sha256(PERSONALITY_LISTING).hexdigest()[:32]
+
+
+def get_personality(personality_id):
+    """Compiled personality by ID (enabled or not), or None"""
+    return REGISTRY.get(personality_id)
@@ -0,0 +1,64 @@
+"""
+Shared fixtures: the Flask app served by the fake models in utils.fakes
+
+The app reads its configuration when it is imported, so the environment is
+set here, before any test module imports it.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import pytest
+
+WORKDIR = tempfile.mkdtemp(prefix="wwts-tests-")
+os.environ.update({
+    "VECTOR_STORE_DIR": os.path.join(WORKDIR, "vector_store"),
+    "VECTOR_BACKEND": "numpy",
+    "EMBEDDING_CACHE_DISK": "0",
+    "CONVERSATION_DIR": "",
+    "OPENAI_API_KEY": "sk-test",
+    # Count tokens without tiktoken's vocabulary, which is downloaded on first use
+    "TOKENIZER": "estimate"
+})
+
+RAG_PERSONALITY = "steve_jobs"
+PROMPT_PERSONALITY = "marcus_aurelius"
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def fakes():
+    """Serve every chat and embeddings call from the fakes"""
+    from utils import clients
+    from utils.fakes import FakeChatModel, FakeEmbeddings
+    chat_model, embeddings = FakeChatModel(), FakeEmbeddings()
+    clients.override(chat_model=chat_model, embeddings=embeddings)
+    yield chat_model, embeddings
+    clients.override()
+
+
+@pytest.fixture
+def app_module(fakes):
+    """The app module, with empty response and retrieval caches"""
+    import app
+    app.response_cache.clear()
+    app.retrieval_cache.clear()
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def sse_events(response):
+    """Parse a server-sent events response into its JSON events"""
+    return [
+        json.loads(line[len("data: "):])
+        for line in response.get_data(as_text=True).splitlines()
+        if line.startswith("data: ")
+    ]
@@ -0,0 +1,15 @@
+"""
+Import-time budget for the app (see benchmarks/import_time.py)
+"""
+
+from benchmarks.import_time import import_report, IMPORT_BUDGET_MS
+
+
+def test_app_imports_within_budget():
+    total_ms, totals, _, eager = import_report("app", runs=3)
+
+    assert not eager, f"imported at startup but should be deferred: {', '.join(eager)}"
+    assert total_ms <= IMPORT_BUDGET_MS, (
+        f"import app took {total_ms:.1f}ms (runs: {', '.join(f'{total:.0f}' for total in totals)}ms), "
+        f"over the {IMPORT_BUDGET_MS:.0f}ms budget"
+    )
@@ -0,0 +1,137 @@
+"""
+Chat, streaming, multi-personality, session and cache routes against the fakes
+"""
+
+import pytest
+from tests.conftest import RAG_PERSONALITY, PROMPT_PERSONALITY, sse_events
+
+
+def chat(client, personality_id=RAG_PERSONALITY, message="How do I find what I love?", **fields):
+    return client.post("/api/chat", json=dict(fields, personality_id=personality_id, message=message))
+
+
+@pytest.mark.parametrize("personality_id", [RAG_PERSONALITY, PROMPT_PERSONALITY])
+def test_chat_answers(client, fakes, personality_id):
+    response = chat(client, personality_id)
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["response"] == fakes[0].response
+    assert data["cached"] is False
+    assert data["session_id"] is None
+    if personality_id == RAG_PERSONALITY:
+        assert data["sources"]
+        assert data["prompt_tokens"] > 0
+    else:
+        assert data["sources"] == []
+
+
+@pytest.mark.parametrize("body, status", [
+    ([1, 2], 400),
+    ({"personality_id": RAG_PERSONALITY}, 400),
+    ({"personality_id": RAG_PERSONALITY, "message": 123}, 400),
+    ({"personality_id": ["x"], "message": "hi"}, 400),
+    ({"personality_id": RAG_PERSONALITY, "message": "hi", "session_id": "../etc"}, 400),
+    ({"personality_id": "nobody", "message": "hi"}, 404),
+])
+@pytest.mark.parametrize("route", ["/api/chat", "/api/chat/stream"])
+def test_chat_rejects_invalid_requests(client, route, body, status):
+    assert client.post(route, json=body).status_code == status
+
+
+def test_stream_sends_sources_then_tokens(client, fakes):
+    response = client.post("/api/chat/stream", json={
+        "personality_id": RAG_PERSONALITY,
+        "message": "How should I think about failure?"
+    })
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    events = sse_events(response)
+    assert events[0]["type"] == "sources" and events[0]["sources"]
+    assert events[-1]["type"] == "done"
+    tokens = [event["content"] for event in events if event["type"] == "token"]
+    assert len(tokens) > 1
+    assert "".join(tokens) == fakes[0].response
+
+
+def test_multi_answers_every_personality(client, fakes):
+    personality_ids = [RAG_PERSONALITY, PROMPT_PERSONALITY]
+    response = client.post("/api/chat/multi", json={
+        "message": "What matters most?",
+        "personality_ids": personality_ids + [RAG_PERSONALITY]
+    })
+
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert sorted(results) == sorted(personality_ids)
+    assert all(result["response"] == fakes[0].response for result in results.values())
+
+
+def test_multi_streams_events_tagged_by_personality(client):
+    personality_ids = [RAG_PERSONALITY, PROMPT_PERSONALITY]
+    response = client.post("/api/chat/multi", json={
+        "message": "What matters most?",
+        "personality_ids": personality_ids,
+        "stream": True
+    })
+
+    events = sse_events(response)
+    for personality_id in personality_ids:
+        tagged = [event["type"] for event in events if event.get("personality_id") == personality_id]
+        assert tagged[0] == "sources"
+        assert "token" in tagged
+        assert tagged[-1] == "done"
+
+
+@pytest.mark.parametrize("body", [
+    [1, 2],
+    {"message": ""},
+    {"message": ["hi"]},
+    {"message": "hi", "personality_ids": "steve_jobs"},
+    {"message": "hi", "personality_ids": [["a"]]},
+])
+def test_multi_rejects_invalid_requests(client, body):
+    assert client.post("/api/chat/multi", json=body).status_code == 400
+
+
+def test_session_keeps_the_conversation(client, app_module, fakes):
+    first = chat(client, message="What did you mean by connecting the dots?", start_session=True)
+    session_id = first.get_json()["session_id"]
+    assert session_id
+
+    second = chat(client, message="Can you say more?", session_id=session_id)
+    assert second.status_code == 200
+    assert second.get_json()["session_id"] == session_id
+
+    history = app_module.conversations.history(session_id, RAG_PERSONALITY)
+    assert "connecting the dots" in history
+    assert "Can you say more?" in history
+    assert fakes[0].response in history
+
+
+def test_stateless_requests_create_no_session(client, app_module):
+    before = app_module.conversations.stats()
+    assert chat(client).get_json()["session_id"] is None
+    assert app_module.conversations.stats() == before
+
+
+def test_repeated_question_is_served_from_cache(client):
+    assert chat(client, PROMPT_PERSONALITY).get_json()["cached"] is False
+    assert chat(client, PROMPT_PERSONALITY).get_json()["cached"] is True
+    assert chat(client, PROMPT_PERSONALITY, bypass_cache=True).get_json()["cached"] is False
+
+
+def test_answers_in_a_conversation_are_not_cached(client):
+    chat(client)
+    session_id = chat(client, start_session=True).get_json()["session_id"]
+    assert chat(client, session_id=session_id).get_json()["cached"] is False
+
+
+def test_cache_stats(client):
+    chat(client, PROMPT_PERSONALITY)
+    chat(client, PROMPT_PERSONALITY)
+
+    stats = client.get("/api/cache/stats").get_json()
+    assert set(stats) == {"responses", "retrievals", "embeddings", "conversations"}
+    assert stats["responses"]["exact_hits"] >= 1
@@ -0,0 +1,42 @@
+"""
+Per-worker memory of the gunicorn deployment (see benchmarks/worker_memory.py)
+
+Starts gunicorn with 1, 4 and 8 workers, with and without preloading, and
+checks that workers forked from a preloaded master share the index instead
+of each holding a private copy. Linux only.
+"""
+
+import os
+import tempfile
+import importlib.util
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    not os.path.exists("/proc/self/smaps_rollup") or importlib.util.find_spec("gunicorn") is None,
+    reason="needs Linux /proc and gunicorn"
+)
+
+# Mean PSS a worker may use, in MB
+WORKER_PSS_BUDGET_MB = float(os.getenv("WORKER_PSS_BUDGET_MB", "250"))
+
+
+@pytest.fixture(scope="module")
+def deployment():
+    from benchmarks.stub_openai import StubOpenAIServer
+    from benchmarks import worker_memory
+    with tempfile.TemporaryDirectory(prefix="wwts-workers-") as workdir, StubOpenAIServer() as stub:
+        yield worker_memory.deployment(workdir, stub, "numpy", embedding_size=1536)
+
+
+@pytest.mark.parametrize("workers", [1, 4, 8])
+def test_preloaded_workers_share_the_index(deployment, workers):
+    from benchmarks.worker_memory import measure
+    env, config = deployment
+
+    separate = measure(workers, False, env, config, startup_timeout=120, chats_per_worker=2)
+    shared = measure(workers, True, env, config, startup_timeout=120, chats_per_worker=2)
+
+    assert len(shared["per_worker"]) == workers
+    assert shared["worker_pss_mb"] <= WORKER_PSS_BUDGET_MB, shared
+    assert shared["worker_uss_mb"] < separate["worker_uss_mb"], (shared, separate)
+    assert shared["total_pss_mb"] < separate["total_pss_mb"], (shared, separate)
@@ -0,0 +1,70 @@
+"""
+Admission control for upstream (OpenAI) calls made from async code
+"""
+
+import os
+import asyncio
+
+# Concurrent upstream calls allowed per process, and how many more may queue
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", "64"))
+UPSTREAM_MAX_WAITING = int(os.getenv("UPSTREAM_MAX_WAITING", "512"))
+
+
+class Overloaded(Exception):
+    """Raised when too many calls are already waiting for an upstream slot"""
+
+
+class AdmissionController:
+    """
+    Bounds concurrent upstream calls with a semaphore and sheds load once
+    the queue of waiting calls is full, instead of letting it grow forever.
+
+    Usage:
+        async with upstream_admission:
+            response = await llm.ainvoke(prompt)
+    """
+
+    def __init__(self, limit=UPSTREAM_CONCURRENCY, max_waiting=UPSTREAM_MAX_WAITING):
+        """
+        Args:
+            limit: Maximum calls in flight at once
+            max_waiting: Maximum calls queued for a slot before Overloaded is raised
+        """
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = None
+        self._loop = None
+
+    def _get_semaphore(self):
+        # A semaphore belongs to one event loop; make a new one if the loop changed
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+    async def __aenter__(self):
+        semaphore = self._get_semaphore()
+        if semaphore.locked() and self.waiting >= self.max_waiting:
+            raise Overloaded(f"{self.waiting} upstream calls already waiting")
+
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {"limit": self.limit, "in_flight": self.in_flight, "waiting": self.waiting}
+
+
+# Shared by every coroutine in the process
+upstream_admission = AdmissionController()
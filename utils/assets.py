@@ -0,0 +1,273 @@
+"""
+Static asset build and the caches that serve pages and assets
+
+`flask --app app assets` writes fingerprinted copies of the images in
+static/ to static/build/. With Pillow installed, each image is resized to
+AVATAR_WIDTHS and encoded as WebP and AVIF, and the fallback is resized to
+the largest width in its own format; without it, the original is copied.
+Every file name carries a
+hash of its content, so it can be cached by browsers for good, and
+static/build/manifest.json maps each original to its files. Without a build
+the pages link the images in static/ as before.
+
+Pages that are the same for every request are rendered once and kept with
+gzip (and brotli, when the brotli module is installed) versions, since
+nearly all of their weight is the CSS and JS inlined in them.
+"""
+
+import os
+import io
+import json
+import gzip
+import shutil
+import hashlib
+import threading
+from markupsafe import Markup, escape
+
+try:
+    import brotli
+except ImportError:  # Optional; pages are still served gzipped
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+# Where the build writes, relative to STATIC_DIR
+ASSET_BUILD_DIR = "build"
+MANIFEST_NAME = "manifest.json"
+
+# Avatar widths to generate: 1x and 2x of the sizes the pages show (40-80px)
+AVATAR_WIDTHS = [int(width) for width in os.getenv("AVATAR_WIDTHS", "80,160").split(",") if width.strip()]
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "80"))
+AVIF_QUALITY = int(os.getenv("AVIF_QUALITY", "55"))
+
+# How long browsers may keep fingerprinted files (a year; they never change)
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+HASH_LENGTH = 10
+
+
+def fingerprint(data):
+    """Short hash of some content, for its file name"""
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def hashed_name(stem, data, extension, width=None):
+    """File name carrying a hash of its content, e.g. kobe_bryant-80.1a2b3c4d5e.webp"""
+    size = f"-{width}" if width else ""
+    return f"{stem}{size}.{fingerprint(data)}{extension}"
+
+
+def image_variants(path, widths):
+    """
+    Resized WebP and AVIF encodings of an image
+
+    Returns:
+        (width, height, {mime type: [(width, bytes), ...]}, fallback), where
+        fallback is the image at the largest width in its own format. No
+        variants or fallback if Pillow isn't installed; AVIF needs a Pillow
+        with AVIF support (11.3+)
+    """
+    try:
+        from PIL import Image, ImageOps, features
+    except ImportError:
+        return None, None, {}, None
+
+    with Image.open(path) as image:
+        original_format = image.format
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+
+        formats = [("image/webp", "WEBP", {"quality": WEBP_QUALITY, "method": 6})]
+        if features.check("avif"):
+            formats.append(("image/avif", "AVIF", {"quality": AVIF_QUALITY}))
+
+        variants = {}
+        # Never upscale; the original's width stands in for any larger one
+        for target in sorted({min(target, width) for target in widths}):
+            resized = image.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+            for mime_type, format_name, options in formats:
+                output = io.BytesIO()
+                resized.save(output, format_name, **options)
+                variants.setdefault(mime_type, []).append((target, output.getvalue()))
+
+        # For browsers without WebP: the largest size, in the original format
+        output = io.BytesIO()
+        options = {"quality": 85, "optimize": True} if original_format == "JPEG" else {}
+        resized.save(output, original_format, **options)
+        fallback = output.getvalue()
+    return width, height, variants, fallback
+
+
+def build_assets(static_dir=STATIC_DIR, widths=AVATAR_WIDTHS):
+    """
+    Write fingerprinted images and their variants to the build directory
+
+    Files from earlier builds that are no longer in the manifest are removed.
+
+    Returns:
+        The manifest: {original name: {'src', 'width', 'height', 'variants'}}
+
+    Raises:
+        ValueError: widths (AVATAR_WIDTHS) is empty or has a width below 1
+    """
+    if not widths or min(widths) < 1:
+        raise ValueError(f"AVATAR_WIDTHS must list one or more positive widths in pixels, got {widths}")
+
+    output_dir = os.path.join(static_dir, ASSET_BUILD_DIR)
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = {}
+    written = {MANIFEST_NAME}
+
+    def write(name, data):
+        with open(os.path.join(output_dir, name), "wb") as f:
+            f.write(data)
+        written.add(name)
+        return name
+
+    for name in sorted(os.listdir(static_dir)):
+        path = os.path.join(static_dir, name)
+        stem, extension = os.path.splitext(name)
+        if not os.path.isfile(path) or extension.lower() not in IMAGE_EXTENSIONS:
+            continue
+
+        with open(path, "rb") as f:
+            original = f.read()
+        width, height, variants, fallback = image_variants(path, widths)
+        if fallback is None or len(fallback) >= len(original):
+            fallback = original
+        entry = {
+            "src": write(hashed_name(stem, fallback, extension.lower()), fallback),
+            "width": width,
+            "height": height,
+            "variants": {}
+        }
+        for mime_type, encoded in variants.items():
+            extension = "." + mime_type.split("/")[1]
+            entry["variants"][mime_type] = [
+                [target, write(hashed_name(stem, data, extension, target), data)]
+                for target, data in encoded
+            ]
+        manifest[name] = entry
+
+        sizes = ", ".join(
+            f"{mime_type.split('/')[1]} {sum(len(data) for _, data in encoded) // 1024}KB"
+            for mime_type, encoded in variants.items()
+        )
+        print(f"{name} ({len(original) // 1024}KB): {sizes or 'fingerprinted only'}")
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    for name in os.listdir(output_dir):
+        if name not in written:
+            stale = os.path.join(output_dir, name)
+            if os.path.isdir(stale):
+                shutil.rmtree(stale)
+            else:
+                os.remove(stale)
+    return manifest
+
+
+def load_manifest(static_dir=STATIC_DIR):
+    """The build's manifest, or an empty one if assets haven't been built"""
+    try:
+        with open(os.path.join(static_dir, ASSET_BUILD_DIR, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        print(f"Ignoring unreadable asset manifest: {str(e)}")
+        return {}
+
+
+def is_fingerprinted(filename):
+    """True for static files written by the build, whose names change with their content"""
+    return filename.startswith(ASSET_BUILD_DIR + "/") and filename != f"{ASSET_BUILD_DIR}/{MANIFEST_NAME}"
+
+
+def picture(manifest, static_url, name, alt, size, **attributes):
+    """
+    Markup for an image, preferring its AVIF and WebP variants
+
+    Args:
+        manifest: The build's manifest (see load_manifest)
+        static_url: Function(filename) returning the URL of a static file
+        name: The image's name in static/
+        alt: Alternative text
+        size: Width it is shown at in CSS pixels, for choosing a variant
+        attributes: Extra <img> attributes, e.g. class_ ('class') or title
+    """
+    entry = manifest.get(name)
+    attributes = {key.rstrip("_"): value for key, value in attributes.items()}
+    attributes.update({"alt": alt, "width": size, "height": size, "decoding": "async"})
+    img_attributes = " ".join(f'{key}="{escape(value)}"' for key, value in attributes.items())
+
+    if entry is None:
+        return Markup(f'<img src="{escape(static_url(name))}" {img_attributes}>')
+
+    sources = []
+    for mime_type in ("image/avif", "image/webp"):
+        variants = entry["variants"].get(mime_type)
+        if variants:
+            srcset = ", ".join(
+                f"{escape(static_url(ASSET_BUILD_DIR + '/' + filename))} {width}w"
+                for width, filename in variants
+            )
+            sources.append(f'<source type="{mime_type}" srcset="{srcset}" sizes="{size}px">')
+    src = escape(static_url(ASSET_BUILD_DIR + "/" + entry["src"]))
+    return Markup(f'<picture>{"".join(sources)}<img src="{src}" {img_attributes}></picture>')
+
+
+class CompressedPage:
+    """A rendered page with its gzip and brotli encodings and ETag"""
+
+    def __init__(self, body):
+        self.body = body.encode("utf-8")
+        self.etag = fingerprint(self.body)
+        self.encodings = {"gzip": gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encodings["br"] = brotli.compress(self.body, mode=brotli.MODE_TEXT)
+
+    def negotiate(self, accept_encodings):
+        """
+        The body to send for a request's Accept-Encoding
+
+        Args:
+            accept_encodings: werkzeug Accept of the request's encodings
+
+        Returns:
+            (encoding or None for identity, body)
+        """
+        for encoding in ("br", "gzip"):
+            if encoding in self.encodings and accept_encodings[encoding] > 0:
+                return encoding, self.encodings[encoding]
+        return None, self.body
+
+
+class PageCache:
+    """Pages rendered once per process, keyed by name"""
+
+    def __init__(self):
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, render):
+        """
+        The cached page for a key, rendering it on first use
+
+        Args:
+            key: Name of the page
+            render: Function returning the page's HTML
+        """
+        page = self._pages.get(key)
+        if page is None:
+            page = CompressedPage(render())
+            with self._lock:
+                page = self._pages.setdefault(key, page)
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
@@ -0,0 +1,199 @@
+"""
+Offline batch question answering: JSONL questions in, JSONL answers out
+
+Questions are read from a JSONL file, one object per line:
+
+    {"id": "faq-1", "question": "How do I find my passion?", "personality_id": "steve_jobs"}
+
+'id' defaults to the line number and 'personality_id' to the personalities
+chosen for the run (every enabled one if none were chosen). Each
+(id, personality) pair is one task. Answers are appended to the output file
+as they finish, which doubles as the checkpoint: a rerun with the same
+output skips every task that already has an answer and retries the ones
+that failed.
+"""
+
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Questions whose embeddings are requested together, and LLM calls in flight
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "64"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+
+def read_tasks(path, personality_ids):
+    """
+    Read questions from a JSONL file
+
+    Args:
+        path: JSONL file of questions
+        personality_ids: Personalities to ask when a line doesn't name one
+
+    Returns:
+        List of task dicts with 'id', 'personality_id' and 'question'
+    """
+    tasks = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({str(e)})")
+            question = item.get("question") if isinstance(item, dict) else None
+            if not isinstance(question, str) or not question.strip():
+                raise ValueError(f"{path}:{line_number}: missing 'question'")
+            if not isinstance(item.get("personality_id") or "", str):
+                raise ValueError(f"{path}:{line_number}: 'personality_id' must be a string")
+
+            task_id = str(item.get("id", line_number))
+            for personality_id in ([item["personality_id"]] if item.get("personality_id") else personality_ids):
+                tasks.append({"id": task_id, "personality_id": personality_id, "question": question})
+    return tasks
+
+
+def task_key(record):
+    return (record["id"], record["personality_id"])
+
+
+def completed_keys(path):
+    """Keys of the tasks already answered in an output file"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a run that was killed mid-write
+                continue
+            if "error" not in record:
+                done.add(task_key(record))
+    return done
+
+
+def open_output(path):
+    """Open an output file for appending, after any partial last line"""
+    output = open(path, "a+", encoding="utf-8")
+    if output.tell() > 0:
+        output.seek(output.tell() - 1)
+        if output.read(1) != "\n":
+            output.write("\n")
+    return output
+
+
+class BatchRunner:
+    """
+    Answers tasks with bounded concurrency, checkpointing to the output file.
+
+    Before a batch of tasks is started, the questions bound for retrieval
+    are embedded in one request to warm the embedding cache, so each query
+    only does a local vector search before its LLM call.
+    """
+
+    def __init__(self, answer, prefetch=None, batch_size=BATCH_SIZE, concurrency=BATCH_CONCURRENCY):
+        """
+        Args:
+            answer: Function(personality_id, question) returning a result dict
+                    with 'response' and 'sources', or 'error'
+            prefetch: Optional function(tasks) run before a batch is started; its
+                      errors are logged, not raised
+            batch_size: Tasks per prefetch
+            concurrency: Maximum concurrent answer calls
+        """
+        self.answer = answer
+        self.prefetch = prefetch
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+
+    def answer_task(self, task):
+        start = time.perf_counter()
+        try:
+            result = self.answer(task["personality_id"], task["question"])
+        except Exception as e:
+            result = {"error": str(e)}
+
+        record = dict(task)
+        if "error" in result:
+            record["error"] = result["error"]
+        else:
+            record["response"] = result["response"]
+            record["sources"] = result.get("sources", [])
+            record["prompt_tokens"] = result.get("prompt_tokens")
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        return record
+
+    def run(self, tasks, output_path):
+        """
+        Answer every task not already in the output file
+
+        Returns:
+            dict with 'tasks', 'skipped', 'answered', 'errors', 'seconds'
+            and 'questions_per_minute'
+        """
+        done = completed_keys(output_path)
+        pending = [task for task in tasks if task_key(task) not in done]
+        print(f"{len(pending)} of {len(tasks)} questions to answer ({len(tasks) - len(pending)} already done)")
+
+        start = time.perf_counter()
+        answered = 0
+        errors = 0
+
+        def write(futures):
+            nonlocal answered, errors
+            for future in futures:
+                record = future.result()
+                output.write(json.dumps(record) + "\n")
+                if "error" in record:
+                    errors += 1
+                    print(f"Failed {record['id']} for {record['personality_id']}: {record['error']}")
+                else:
+                    answered += 1
+            output.flush()
+
+        with open_output(output_path) as output, \
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch") as executor:
+            in_flight = set()
+            try:
+                for i in range(0, len(pending), self.batch_size):
+                    batch = pending[i:i + self.batch_size]
+                    if self.prefetch is not None:
+                        # Only a warm-up: the answers still work without it
+                        try:
+                            self.prefetch(batch)
+                        except Exception as e:
+                            print(f"Prefetch failed, answering without it: {str(e)}")
+                    in_flight.update(executor.submit(self.answer_task, task) for task in batch)
+
+                    # Prefetch the next batch once only running calls are left
+                    while len(in_flight) > self.concurrency:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        write(finished)
+                    print(f"Answered {answered + errors}/{len(pending)}")
+
+                while in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    write(finished)
+            except KeyboardInterrupt:
+                # Keep what finished; the rest is picked up on the next run
+                running = [future for future in in_flight if not future.cancel()]
+                write(wait(running).done)
+                raise
+
+        seconds = time.perf_counter() - start
+        stats = {
+            "tasks": len(tasks),
+            "skipped": len(tasks) - len(pending),
+            "answered": answered,
+            "errors": errors,
+            "seconds": round(seconds, 3),
+            "questions_per_minute": round((answered + errors) / seconds * 60, 1) if seconds > 0 else 0.0
+        }
+        print(f"Answered {answered} questions ({errors} failed) in {seconds:.1f}s: "
+              f"{stats['questions_per_minute']} questions/min")
+        return stats
@@ -0,0 +1,49 @@
+"""
+Chroma vector store that also takes precomputed embeddings
+"""
+
+import chromadb
+from langchain_community.vectorstores import Chroma
+
+# The collection langchain's Chroma has always used, so existing stores still load
+COLLECTION_NAME = "langchain"
+
+
+class ChromaVectorStore(Chroma):
+    """
+    langchain's Chroma store over a persistent chromadb client.
+
+    add_embeddings() upserts vectors that were already computed (by the bulk
+    ingestor) through chromadb's public collection API, so they aren't
+    embedded a second time.
+    """
+
+    def __init__(self, embedding_function, persist_directory, collection_name=COLLECTION_NAME):
+        """
+        Args:
+            embedding_function: Embeddings model used for queries and new texts
+            persist_directory: Directory holding the chromadb database
+            collection_name: Collection the chunks are stored in
+        """
+        client = chromadb.PersistentClient(path=persist_directory)
+        super().__init__(
+            collection_name=collection_name,
+            embedding_function=embedding_function,
+            persist_directory=persist_directory,
+            client=client
+        )
+        self.collection = client.get_collection(collection_name, embedding_function=None)
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None):
+        """Add (or replace) documents with precomputed embeddings"""
+        texts = list(texts)
+        if not texts:
+            return list(ids or [])
+        self.collection.upsert(
+            ids=list(ids),
+            embeddings=[list(vector) for vector in embeddings],
+            documents=texts,
+            # chromadb rejects empty metadata dicts
+            metadatas=[metadata or None for metadata in metadatas] if metadatas is not None else None
+        )
+        return list(ids)
@@ -0,0 +1,138 @@
+"""
+Token-aware chunking on sentence and paragraph boundaries
+
+Documents are cut into paragraphs (blank lines) and sentences, and the
+sentences are packed into chunks of at most CHUNK_TOKENS tokens. A chunk
+starts a new paragraph whenever the current one is at least half full, and
+optionally repeats the last CHUNK_OVERLAP_TOKENS tokens of whole sentences
+from the previous chunk. Chunks that add no sentence not already indexed
+(e.g. a passage present in two sources) are dropped. Every chunk records
+its size in metadata['token_count'].
+"""
+
+import os
+import re
+import hashlib
+from langchain_core.documents import Document
+from utils.tokens import count_tokens, truncate_tokens
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|(?<=[.!?][\"”’)\]])\s+")
+WHITESPACE = re.compile(r"\s+")
+
+
+def paragraphs(text):
+    """Paragraphs of a text, with line breaks inside a paragraph folded into spaces"""
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        paragraph = WHITESPACE.sub(" ", paragraph).strip()
+        if paragraph:
+            yield paragraph
+
+
+def sentences(paragraph):
+    return [sentence for sentence in SENTENCE_BREAK.split(paragraph) if sentence]
+
+
+def sentence_key(sentence):
+    return hashlib.sha256(sentence.casefold().encode("utf-8")).digest()
+
+
+def split_long(sentence, max_tokens):
+    """Cut a sentence longer than max_tokens into pieces that fit"""
+    pieces = []
+    while count_tokens(sentence) > max_tokens:
+        piece = truncate_tokens(sentence, max_tokens)
+        # Prefer to cut between words
+        cut = piece.rfind(" ")
+        if cut > len(piece) // 2:
+            piece = piece[:cut]
+        if not piece.strip():
+            piece = sentence[:max(1, len(sentence) // 2)]
+        pieces.append(piece.strip())
+        sentence = sentence[len(piece):].strip()
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
+
+def split_text(text, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, seen=None):
+    """
+    Split text into chunks on sentence and paragraph boundaries
+
+    Args:
+        text: Text to split
+        max_tokens: Maximum tokens per chunk
+        overlap_tokens: Tokens of whole trailing sentences repeated in the next chunk
+        seen: Set of sentence keys already indexed, shared across documents
+              to drop duplicate passages (updated in place)
+
+    Returns:
+        List of chunk texts
+    """
+    seen = set() if seen is None else seen
+    units = []
+    for paragraph in paragraphs(text):
+        for i, sentence in enumerate(sentences(paragraph)):
+            for j, piece in enumerate(split_long(sentence, max_tokens)):
+                units.append({
+                    "text": piece,
+                    "tokens": count_tokens(piece),
+                    "paragraph_start": i == 0 and j == 0
+                })
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    has_new = False
+
+    def emit():
+        if has_new:
+            chunks.append(" ".join(unit["text"] for unit in current))
+
+    for unit in units:
+        full = current_tokens + unit["tokens"] > max_tokens
+        paragraph_break = unit["paragraph_start"] and current_tokens >= max_tokens // 2
+        if current and (full or paragraph_break):
+            emit()
+            # Carry whole trailing sentences over as overlap
+            carried = []
+            carried_tokens = 0
+            for previous in reversed(current):
+                if carried_tokens + previous["tokens"] > overlap_tokens:
+                    break
+                carried.insert(0, previous)
+                carried_tokens += previous["tokens"]
+            if carried_tokens + unit["tokens"] > max_tokens:
+                carried, carried_tokens = [], 0
+            current, current_tokens, has_new = carried, carried_tokens, False
+
+        key = sentence_key(unit["text"])
+        if key not in seen:
+            seen.add(key)
+            has_new = True
+        current.append(unit)
+        current_tokens += unit["tokens"]
+
+    if current:
+        emit()
+    return chunks
+
+
+def split_documents(documents, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Split documents into token-bounded chunks, keeping each document's metadata
+
+    Returns:
+        List of chunk Documents with metadata['token_count']
+    """
+    seen = set()
+    chunks = []
+    for document in documents:
+        for text in split_text(document.page_content, max_tokens, overlap_tokens, seen):
+            metadata = dict(document.metadata)
+            metadata["token_count"] = count_tokens(text)
+            chunks.append(Document(page_content=text, metadata=metadata))
+    return chunks
@@ -0,0 +1,173 @@
+"""
+Process-wide registry of LLM and embeddings clients
+
+Building a ChatOpenAI or OpenAIEmbeddings per request throws away the HTTP
+connection pool (and its TLS sessions) every time. The registry builds each
+client once, on a shared keep-alive httpx pool, and hands the same instance
+to every request.
+"""
+
+import os
+import json
+import threading
+from langchain_core.embeddings import Embeddings
+from utils.admission import UPSTREAM_CONCURRENCY
+from utils.scheduler import upstream
+
+# Defaults for every personality
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+
+# Per-personality overrides, e.g. '{"kobe_bryant": {"temperature": 0.9}}'
+MODEL_OVERRIDES = json.loads(os.getenv("LLM_OVERRIDES", "{}"))
+
+# Connection pool shared by all OpenAI clients. Never smaller than the cap on
+# upstream calls in flight, or calls let through would queue for a connection
+# and time out there instead of being shed by the admission controller
+HTTP_POOL_SIZE = max(int(os.getenv("HTTP_POOL_SIZE", str(UPSTREAM_CONCURRENCY))), UPSTREAM_CONCURRENCY)
+HTTP_KEEPALIVE = int(os.getenv("HTTP_KEEPALIVE", str(HTTP_POOL_SIZE)))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+_lock = threading.Lock()
+_http_client = None
+_async_http_client = None
+_chat_models = {}
+_embeddings = None
+
+# Fixed clients installed by override(), used instead of OpenAI
+_chat_model_override = None
+_embeddings_override = None
+
+
+def get_http_client():
+    """Shared keep-alive HTTP client for the OpenAI SDK"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            import httpx
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_SIZE,
+                    max_keepalive_connections=HTTP_KEEPALIVE,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+            )
+        return _http_client
+
+
+def get_async_http_client():
+    """Shared keep-alive HTTP client for async calls (ainvoke, aembed_*)"""
+    global _async_http_client
+    with _lock:
+        if _async_http_client is None:
+            import httpx
+            _async_http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_SIZE,
+                    max_keepalive_connections=HTTP_KEEPALIVE,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+            )
+        return _async_http_client
+
+
+def model_settings(personality_id=None):
+    """Model name and temperature for a personality"""
+    settings = {"model": LLM_MODEL, "temperature": LLM_TEMPERATURE}
+    settings.update(MODEL_OVERRIDES.get(personality_id, {}))
+    return settings
+
+
+def get_chat_model(personality_id=None):
+    """
+    Shared chat model for a personality
+
+    Personalities with the same model and temperature share one client.
+    """
+    if _chat_model_override is not None:
+        return _chat_model_override
+
+    settings = model_settings(personality_id)
+    key = (settings["model"], settings["temperature"])
+    chat_model = _chat_models.get(key)
+    if chat_model is None:
+        from langchain_openai import ChatOpenAI
+        http_client = get_http_client()
+        http_async_client = get_async_http_client()
+        with _lock:
+            chat_model = _chat_models.get(key)
+            if chat_model is None:
+                chat_model = ChatOpenAI(
+                    model=settings["model"],
+                    temperature=settings["temperature"],
+                    # Retried by utils.scheduler, within the request's deadline
+                    max_retries=0,
+                    http_client=http_client,
+                    http_async_client=http_async_client
+                )
+                _chat_models[key] = chat_model
+    return chat_model
+
+
+def get_embeddings():
+    """Shared embeddings model"""
+    global _embeddings
+    if _embeddings_override is not None:
+        return _embeddings_override
+
+    if _embeddings is None:
+        from langchain_openai import OpenAIEmbeddings
+        http_client = get_http_client()
+        http_async_client = get_async_http_client()
+        with _lock:
+            if _embeddings is None:
+                _embeddings = OpenAIEmbeddings(
+                    max_retries=0,
+                    http_client=http_client,
+                    http_async_client=http_async_client
+                )
+    return _embeddings
+
+
+class SharedEmbeddings(Embeddings):
+    """
+    Embeddings that always delegate to the registry's current client.
+
+    Lets long-lived objects (caches, vector stores) hold an embeddings
+    model without building the OpenAI client at import time.
+    """
+
+    @property
+    def model(self):
+        embeddings = get_embeddings()
+        return getattr(embeddings, "model", type(embeddings).__name__)
+
+    def embed_documents(self, texts):
+        return upstream.call(get_embeddings().embed_documents, texts)
+
+    def embed_query(self, text):
+        return upstream.call(get_embeddings().embed_query, text)
+
+
+def override(chat_model=None, embeddings=None):
+    """Serve fixed clients (e.g. fakes for tests and benchmarks) instead of OpenAI"""
+    global _chat_model_override, _embeddings_override
+    _chat_model_override = chat_model
+    _embeddings_override = embeddings
+
+
+def reset():
+    """Drop every cached client so the next call builds fresh ones"""
+    global _http_client, _async_http_client, _embeddings
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+        _http_client = None
+        # The async client can only be closed from its event loop; just drop it
+        _async_http_client = None
+        _chat_models.clear()
+        _embeddings = None
@@ -0,0 +1,138 @@
+"""
+Context assembly: packs retrieved chunks into a prompt token budget
+
+Retrieved chunks arrive best first. They are taken in that order until the
+budget left after the system prompt, question and conversation history is
+spent; a chunk that no longer fits is cut back to whole sentences if enough
+room is left, and skipped otherwise. Rank order is used rather than a score
+cutoff on purpose: hybrid retrieval returns RRF-fused ranks whose scores
+mean nothing from one question to the next. The history is trimmed, oldest
+turns first, so at least CONTEXT_MIN_TOKENS are left for the chunks.
+Chunks that mostly repeat one already taken (overlapping windows, the same
+passage in two sources) are dropped.
+
+Chunk sizes come from metadata['token_count'] (see utils/chunking.py) and
+are only counted here for stores built before it was recorded.
+"""
+
+import os
+import re
+from utils.chunking import sentences
+from utils.tokens import count_tokens
+
+# Default prompt budget per request (system prompt, history, context and
+# question); personalities can set their own with 'prompt_token_budget'
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1600"))
+# Tokens of the budget kept for retrieved chunks however long the conversation
+CONTEXT_MIN_TOKENS = int(os.getenv("CONTEXT_MIN_TOKENS", "600"))
+# Chunks retrieved as candidates for the context
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "4"))
+# Share of a chunk's word trigrams found in a chunk already taken above
+# which it counts as a near-duplicate
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+# Smallest useful piece of a chunk cut to fit the remaining budget
+CONTEXT_MIN_TRIM_TOKENS = int(os.getenv("CONTEXT_MIN_TRIM_TOKENS", "40"))
+
+CONTEXT_SEPARATOR = "\n\n"
+WORD = re.compile(r"\w+")
+
+
+def chunk_tokens(document):
+    """Tokens in a chunk, from its metadata when recorded at indexing"""
+    token_count = document.metadata.get("token_count")
+    if token_count is None:
+        token_count = count_tokens(document.page_content)
+    return token_count
+
+
+def template_tokens(template):
+    """Tokens in the literal text of a system prompt template"""
+    token_count = getattr(template, "token_count", None)
+    if token_count is None:
+        token_count = count_tokens(str(template))
+    return token_count
+
+
+def shingles(text):
+    """Word trigrams of a text, for near-duplicate detection"""
+    words = WORD.findall(text.casefold())
+    if len(words) < 3:
+        return {tuple(words)}
+    return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def is_near_duplicate(candidate, taken, threshold=CONTEXT_DUPLICATE_THRESHOLD):
+    """Whether most of a chunk's trigrams are already in one of the chunks taken"""
+    return any(
+        len(candidate & other) >= threshold * min(len(candidate), len(other))
+        for other in taken
+    )
+
+
+def trim_to_tokens(text, max_tokens):
+    """The leading whole sentences of text that fit in max_tokens, or ''"""
+    kept = []
+    used = 0
+    for sentence in sentences(text):
+        tokens = count_tokens(sentence)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    return " ".join(kept)
+
+
+def pack_context(documents, max_tokens, duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD,
+                 min_trim_tokens=CONTEXT_MIN_TRIM_TOKENS):
+    """
+    Choose, trim and join chunks to fit a token budget
+
+    Args:
+        documents: Retrieved chunks, most relevant first
+        max_tokens: Tokens available for the context
+        duplicate_threshold: Trigram overlap at which a chunk is a near-duplicate
+        min_trim_tokens: Smallest piece of a chunk worth keeping when trimming
+
+    Returns:
+        dict with 'context' (joined text), 'documents' (the chunks used, with
+        trimmed ones cut down), 'tokens', 'trimmed' and 'dropped'
+    """
+    from langchain_core.documents import Document
+
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    used = []
+    taken = []
+    tokens = 0
+    trimmed = 0
+    dropped = 0
+    for document in documents:
+        candidate = shingles(document.page_content)
+        if is_near_duplicate(candidate, taken, duplicate_threshold):
+            dropped += 1
+            continue
+
+        available = max_tokens - tokens - (separator_tokens if used else 0)
+        document_tokens = chunk_tokens(document)
+        if document_tokens > available:
+            text = trim_to_tokens(document.page_content, available) if available >= min_trim_tokens else ""
+            if not text:
+                dropped += 1
+                continue
+            document_tokens = count_tokens(text)
+            document = Document(
+                page_content=text,
+                metadata=dict(document.metadata, token_count=document_tokens, trimmed=True)
+            )
+            trimmed += 1
+
+        tokens += document_tokens + (separator_tokens if used else 0)
+        used.append(document)
+        taken.append(candidate)
+
+    return {
+        "context": CONTEXT_SEPARATOR.join(document.page_content for document in used),
+        "documents": used,
+        "tokens": tokens,
+        "trimmed": trimmed,
+        "dropped": dropped
+    }
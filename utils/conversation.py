@@ -0,0 +1,360 @@
+"""
+Server-side conversation memory
+
+Each (session, personality) pair keeps the most recent turns that fit in a
+token budget. Older turns are folded into a running summary by the chat
+model, so the history added to a prompt stays bounded however long the
+conversation runs.
+
+Summaries are written in the background, so the turn that overflows the
+budget isn't kept waiting for them; until a summary is in, the turns it
+covers stay in the history as they are.
+
+Conversations live in an in-memory LRU. Idle ones are evicted after a TTL.
+With an on-disk backend (CONVERSATION_DIR) every change is also written
+through to disk, so evicted conversations come back on their next turn and
+survive restarts, until they have been idle for CONVERSATION_DISK_TTL.
+Without one, each process keeps its own conversations.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils.tokens import count_tokens, truncate_tokens
+from utils import metrics
+
+# Tokens of recent turns kept verbatim; older turns are summarized
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1200"))
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "300"))
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "1000"))
+CONVERSATION_IDLE_TTL = float(os.getenv("CONVERSATION_IDLE_TTL", "1800"))
+CONVERSATION_DIR = os.getenv("CONVERSATION_DIR")
+# Seconds without a turn before a conversation is deleted from disk, and how
+# often each process looks for such conversations
+CONVERSATION_DISK_TTL = float(os.getenv("CONVERSATION_DISK_TTL", str(7 * 24 * 3600)))
+CONVERSATION_SWEEP_INTERVAL = float(os.getenv("CONVERSATION_SWEEP_INTERVAL", "600"))
+# Threads writing summaries in the background
+CONVERSATION_SUMMARY_WORKERS = int(os.getenv("CONVERSATION_SUMMARY_WORKERS", "4"))
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+SUMMARY_PROMPT = """Summarize this conversation between a user and an advisor in at most {max_words} words.
+Keep what the user said about themselves, their situation and goals, and the advice already given.
+Write plain text, no lists.
+
+Summary so far:
+{summary}
+
+New turns:
+{turns}
+
+Updated summary:"""
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def valid_session_id(session_id):
+    return isinstance(session_id, str) and bool(SESSION_ID_PATTERN.match(session_id))
+
+
+def format_turns(turns):
+    return "\n".join(f"User: {turn['question']}\nYou: {turn['answer']}" for turn in turns)
+
+
+def add_history(context, history):
+    """Append the conversation so far to the context of a prompt"""
+    if not history:
+        return context
+    return f"{context}\n\nYour conversation with this user so far:\n{history}"
+
+
+def trim_history(history, max_tokens):
+    """
+    The most recent part of a formatted history that fits in max_tokens
+
+    Whole turns are dropped oldest first (the summary of earlier turns goes
+    before any of them), so that add_history adds at most max_tokens.
+    """
+    if not history or count_tokens(add_history("", history)) <= max_tokens:
+        return history
+    parts = re.split(r"\n\n?(?=User: )", history)
+    while parts:
+        parts.pop(0)
+        trimmed = "\n".join(parts)
+        if count_tokens(add_history("", trimmed)) <= max_tokens:
+            return trimmed
+    return ""
+
+
+def summarize_with_llm(summary, turns, max_tokens):
+    """Fold turns into the running summary with the shared chat model"""
+    from utils.clients import get_chat_model
+    from utils.scheduler import upstream
+    prompt = SUMMARY_PROMPT.format(
+        max_words=max(1, max_tokens * 3 // 4),
+        summary=summary or "(none)",
+        turns=format_turns(turns)
+    )
+    return upstream.call(get_chat_model().invoke, prompt, timeout_arg="timeout").content.strip()
+
+
+class DiskBackend:
+    """Stores each conversation as a JSON file in a directory, for up to ttl seconds after its last turn"""
+
+    def __init__(self, directory, ttl=CONVERSATION_DISK_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        name = hashlib.sha256("/".join(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.json")
+
+    def load(self, key):
+        try:
+            with open(self._path(key)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - state.get("last_active", 0) > self.ttl:
+            self.delete(key)
+            return None
+        return state
+
+    def save(self, key, state):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self):
+        """Delete conversations (and leftover temporary files) idle for longer than the TTL"""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+
+class ConversationStore:
+    """
+    Token-bounded conversation history per (session_id, personality_id)
+
+    Usage:
+        history = store.history(session_id, personality_id)
+        ... answer the question with the history in the prompt ...
+        store.append(session_id, personality_id, question, answer)
+    """
+
+    def __init__(
+        self,
+        token_budget=CONVERSATION_TOKEN_BUDGET,
+        summary_tokens=CONVERSATION_SUMMARY_TOKENS,
+        max_sessions=CONVERSATION_MAX_SESSIONS,
+        idle_ttl=CONVERSATION_IDLE_TTL,
+        backend=None,
+        summarizer=None,
+        summary_workers=CONVERSATION_SUMMARY_WORKERS
+    ):
+        """
+        Args:
+            token_budget: Tokens of recent turns kept verbatim
+            summary_tokens: Maximum size of the running summary
+            max_sessions: Conversations kept in memory
+            idle_ttl: Seconds without a turn before a conversation is evicted from memory
+            backend: Optional store (e.g. DiskBackend) written through on every change
+            summarizer: Callable (summary, turns, max_tokens) -> new summary
+            summary_workers: Threads writing summaries in the background
+        """
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.backend = backend
+        self.summarizer = summarizer or summarize_with_llm
+        self.summary_workers = summary_workers
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._last_sweep = 0.0
+        self.summaries = 0
+        self.evictions = 0
+
+    def _evict(self, now):
+        # Least recently used first, so idle conversations are at the front
+        while self._sessions:
+            key, state = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and now - state["last_active"] <= self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def _get(self, key, now):
+        """The state for a conversation (caller holds the lock)"""
+        self._evict(now)
+        state = self._sessions.get(key)
+        if state is None and self.backend is not None:
+            state = self.backend.load(key)
+            if state is not None:
+                self._sessions[key] = state
+        if state is not None:
+            self._sessions.move_to_end(key)
+        return state
+
+    def history(self, session_id, personality_id):
+        """
+        The conversation so far, formatted for a prompt
+
+        Returns:
+            str, empty for a new conversation
+        """
+        with self._lock:
+            state = self._get((session_id, personality_id), time.time())
+            if state is None:
+                return ""
+            summary = state["summary"]
+            # Turns waiting to be summarized are still part of the conversation
+            turns = state.get("pending", []) + state["turns"]
+
+        parts = []
+        if summary:
+            parts.append(f"Summary of the earlier conversation: {summary}")
+        if turns:
+            parts.append(format_turns(turns))
+        return "\n\n".join(parts)
+
+    def append(self, session_id, personality_id, question, answer):
+        """Add a turn, summarizing the oldest turns once they exceed the budget"""
+        key = (session_id, personality_id)
+        # No single turn may take more than the whole budget
+        half = max(1, self.token_budget // 2)
+        turn = {
+            "question": truncate_tokens(question, half),
+            "answer": truncate_tokens(answer, half)
+        }
+        turn["tokens"] = count_tokens(turn["question"]) + count_tokens(turn["answer"])
+
+        now = time.time()
+        with self._lock:
+            state = self._get(key, now)
+            if state is None:
+                state = self._sessions[key] = {"summary": "", "turns": []}
+            state["turns"].append(turn)
+            state["last_active"] = now
+
+            total = sum(t["tokens"] for t in state["turns"])
+            pending = state.setdefault("pending", [])
+            while total > self.token_budget:
+                oldest = state["turns"].pop(0)
+                total -= oldest["tokens"]
+                pending.append(oldest)
+            # One summarizer per conversation, which folds in whatever is pending when it runs
+            start_summary = bool(pending) and not state.get("summarizing")
+            if start_summary:
+                state["summarizing"] = True
+            sweep = self.backend is not None and now - self._last_sweep > CONVERSATION_SWEEP_INTERVAL
+            if sweep:
+                self._last_sweep = now
+            self._evict(now)
+
+        if start_summary:
+            self._submit(self._summarize, key, state)
+        if sweep:
+            self._submit(self.backend.sweep)
+        self._save(key, state)
+
+    def _submit(self, fn, *args):
+        # Threads don't survive a fork, so each process starts its own pool
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.summary_workers,
+                thread_name_prefix="conversation-summary"
+            )
+            self._executor_pid = os.getpid()
+        self._executor.submit(fn, *args)
+
+    def _summarize(self, key, state):
+        """Fold pending turns into the summary until there are none left (runs in the background)"""
+        personality_id = key[1]
+        while True:
+            with self._lock:
+                overflow = list(state["pending"])
+                summary = state["summary"]
+                if not overflow:
+                    state["summarizing"] = False
+                    return
+            try:
+                with metrics.stage(personality_id, "summarize"):
+                    summary = self.summarizer(summary, overflow, self.summary_tokens)
+                summary = truncate_tokens(summary, self.summary_tokens)
+                with self._lock:
+                    self.summaries += 1
+            except Exception as e:
+                # Losing old turns is better than keeping them forever
+                print(f"Conversation summary failed: {str(e)}")
+                metrics.record_error(personality_id, "summarize")
+            with self._lock:
+                state["summary"] = summary
+                del state["pending"][:len(overflow)]
+            self._save(key, state)
+
+    def _save(self, key, state):
+        if self.backend is None:
+            return
+        with self._lock:
+            if state.get("cleared"):
+                return
+            snapshot = {
+                "summary": state["summary"],
+                "turns": list(state["turns"]),
+                "pending": list(state.get("pending", [])),
+                "last_active": state["last_active"]
+            }
+        self.backend.save(key, snapshot)
+
+    def clear(self, session_id, personality_id):
+        """Forget a conversation"""
+        key = (session_id, personality_id)
+        with self._lock:
+            state = self._sessions.pop(key, None)
+            if state is not None:
+                # So a summary still being written doesn't save it again
+                state["cleared"] = True
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "summaries": self.summaries,
+                "evictions": self.evictions
+            }
+
+
+def create_conversation_store():
+    """Conversation store configured from the environment"""
+    backend = DiskBackend(CONVERSATION_DIR) if CONVERSATION_DIR else None
+    return ConversationStore(backend=backend)
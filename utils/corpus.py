@@ -0,0 +1,143 @@
+"""
+Corpus registry: which source documents back each personality, and how to load them
+"""
+
+import os
+import glob
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from langchain_core.documents import Document
+
+# Source files, directories or glob patterns per personality. Personalities
+# whose patterns match no files are answered from the system prompt alone.
+CORPORA = {
+    "steve_jobs": ["steve_job_pdf.pdf", "corpus/steve_jobs"],
+    "kobe_bryant": ["corpus/kobe_bryant"],
+    "marcus_aurelius": ["corpus/marcus_aurelius"],
+}
+
+# Human readable titles for known source files
+SOURCE_TITLES = {
+    "steve_job_pdf.pdf": "Stanford Commencement Speech",
+}
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md", ".markdown", ".jsonl")
+
+# Worker processes used to parse several files at once
+CORPUS_LOAD_WORKERS = int(os.getenv("CORPUS_LOAD_WORKERS", "4"))
+
+
+def resolve_sources(patterns):
+    """
+    Expand files, directories and glob patterns into a sorted list of
+    supported source files
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, "**", "*"), recursive=True)
+        else:
+            matches = glob.glob(pattern)
+        for path in matches:
+            if os.path.isfile(path) and path.lower().endswith(SUPPORTED_EXTENSIONS):
+                paths.add(os.path.normpath(path))
+    return sorted(paths)
+
+
+def get_sources(personality_id):
+    """Source files for a personality"""
+    return resolve_sources(CORPORA.get(personality_id, []))
+
+
+def has_corpus(personality_id):
+    """True if a personality has any source documents to retrieve from"""
+    return bool(get_sources(personality_id))
+
+
+def source_title(metadata):
+    """Title shown to users for a retrieved document"""
+    if metadata.get("title_override"):
+        return metadata["title_override"]
+    source = metadata.get("source", "")
+    name = os.path.basename(source)
+    if name in SOURCE_TITLES:
+        return SOURCE_TITLES[name]
+    return os.path.splitext(name)[0].replace("_", " ").replace("-", " ").title()
+
+
+def lazy_load_file(path):
+    """Yield the documents in one source file, a page or record at a time"""
+    extension = os.path.splitext(path)[1].lower()
+
+    if extension == ".pdf":
+        from langchain_community.document_loaders import PyPDFLoader
+        yield from PyPDFLoader(path).lazy_load()
+
+    elif extension == ".jsonl":
+        # Transcripts: one JSON object per line with 'text' (or 'content')
+        with open(path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    # One bad line shouldn't keep the rest of the corpus out of the index
+                    print(f"Skipping {path}:{line_number + 1}: invalid JSON ({str(e)})")
+                    continue
+                if not isinstance(record, dict):
+                    print(f"Skipping {path}:{line_number + 1}: not a JSON object")
+                    continue
+                text = record.get("text") or record.get("content") or ""
+                if not isinstance(text, str):
+                    print(f"Skipping {path}:{line_number + 1}: 'text' is not a string")
+                    continue
+                if not text.strip():
+                    continue
+                metadata = {"source": path, "page": line_number}
+                if record.get("title"):
+                    metadata["title_override"] = str(record["title"])
+                if record.get("speaker"):
+                    metadata["speaker"] = str(record["speaker"])
+                yield Document(page_content=text, metadata=metadata)
+
+    else:
+        # Plain text and markdown are treated as a single page
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        if text.strip():
+            yield Document(page_content=text, metadata={"source": path, "page": 0})
+
+
+def load_file(path):
+    """Load every document in one source file (runs in a worker process)"""
+    return list(lazy_load_file(path))
+
+
+def iter_documents(paths, max_workers=CORPUS_LOAD_WORKERS):
+    """
+    Stream the documents of several source files
+
+    A single file is read lazily in-process. Several files are parsed in a
+    process pool and yielded file by file, in order, as they become ready.
+    The pool's workers are started fresh rather than forked, since this
+    runs in threaded processes (preload's thread pool, gunicorn) where a
+    fork can copy a lock some other thread holds and deadlock on it.
+    """
+    if len(paths) <= 1 or max_workers <= 1:
+        for path in paths:
+            yield from lazy_load_file(path)
+        return
+
+    start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(
+        max_workers=min(max_workers, len(paths)),
+        mp_context=multiprocessing.get_context(start_method)
+    ) as executor:
+        for documents in executor.map(load_file, paths):
+            yield from documents
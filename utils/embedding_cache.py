@@ -0,0 +1,176 @@
+"""
+Embedding cache that skips the embeddings API for text it has already seen
+"""
+
+import os
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text):
+    """Normalize text so trivially different strings share a cache entry"""
+    return " ".join(text.split()).casefold()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings model with a bounded in-memory LRU and an optional
+    on-disk store, keyed by a hash of the normalized text.
+
+    Queries and documents share the same cache, so a question that matches
+    an already embedded chunk (or a repeated suggested prompt) never goes
+    back to the network. Vectors are kept as float32 arrays (a quarter of
+    the size of a list of Python floats) and returned as lists.
+
+    The lock only guards the in-memory LRU. The on-disk store is read and
+    written outside it, over one sqlite connection per thread, and keeps
+    the max_disk_rows most recently written vectors.
+    """
+
+    def __init__(self, embeddings, max_size=10000, cache_dir=None, namespace=None, max_disk_rows=20000):
+        """
+        Args:
+            embeddings: The underlying embeddings model
+            max_size: Maximum number of vectors kept in memory
+            cache_dir: Directory for the on-disk store (None keeps it in memory only)
+            namespace: Cache namespace, defaults to the model name
+            max_disk_rows: Maximum number of vectors kept on disk, oldest written dropped first
+        """
+        self.embeddings = embeddings
+        self.max_size = max_size
+        self.max_disk_rows = max_disk_rows
+        self._namespace = namespace
+        self.db_path = os.path.join(cache_dir, "embedding_cache.sqlite3") if cache_dir else None
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def namespace(self):
+        """Cache namespace, resolved lazily so the model is only built on use"""
+        if self._namespace:
+            return self._namespace
+        return getattr(self.embeddings, "model", type(self.embeddings).__name__)
+
+    def key(self, text):
+        """Cache key for a piece of text"""
+        data = f"{self.namespace}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha256(data).hexdigest()
+
+    def _connection(self):
+        # One connection per thread, and none carried across a fork
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=30)
+            # Readers don't wait for a writer in WAL mode
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+            )
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def _remember(self, key, vector):
+        """Keep a float32 array in the LRU (caller holds the lock)"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys):
+        """Return cached vectors (float32 arrays) for the keys that are cached"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+
+        missing = [key for key in keys if key not in found]
+        if missing and self.db_path:
+            db = self._connection()
+            loaded = {}
+            # Stay under sqlite's limit on query parameters
+            for i in range(0, len(missing), 500):
+                batch = missing[i:i + 500]
+                rows = db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall()
+                loaded.update((key, array("f", vector)) for key, vector in rows)
+            if loaded:
+                with self._lock:
+                    for key, vector in loaded.items():
+                        self._remember(key, vector)
+                found.update(loaded)
+        return found
+
+    def _store(self, items):
+        """Store (key, vector) pairs in memory and on disk"""
+        items = [(key, array("f", vector)) for key, vector in items]
+        with self._lock:
+            for key, vector in items:
+                self._remember(key, vector)
+
+        if self.db_path:
+            db = self._connection()
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in items]
+                )
+                # Rowids grow with every write, so this keeps the newest max_disk_rows
+                db.execute(
+                    "DELETE FROM embeddings WHERE rowid <= (SELECT max(rowid) FROM embeddings) - ?",
+                    (self.max_disk_rows,)
+                )
+
+    def _count(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def embed_documents(self, texts):
+        """Embed documents, only sending uncached texts to the model"""
+        keys = [self.key(text) for text in texts]
+        found = self._lookup(set(keys))
+
+        # Embed each distinct uncached text once
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in pending:
+                pending[key] = text
+
+        self._count(len(texts) - len(pending), len(pending))
+
+        if pending:
+            vectors = self.embeddings.embed_documents(list(pending.values()))
+            new_items = list(zip(pending.keys(), vectors))
+            self._store(new_items)
+            found.update(new_items)
+
+        return [found[key].tolist() if isinstance(found[key], array) else found[key] for key in keys]
+
+    def embed_query(self, text):
+        """Embed a query, reusing the cached vector when there is one"""
+        key = self.key(text)
+        found = self._lookup([key])
+        if key in found:
+            self._count(1, 0)
+            return found[key].tolist()
+
+        self._count(0, 1)
+        vector = self.embeddings.embed_query(text)
+        self._store([(key, vector)])
+        return vector
+
+    def stats(self):
+        """Cache hit/miss counters"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._memory)}
@@ -0,0 +1,116 @@
+"""
+Deterministic fake models for exercising the pipeline offline
+"""
+
+import time
+import hashlib
+import threading
+import asyncio
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeRateLimitError(Exception):
+    """Raised by the fakes to simulate an HTTP 429 from the API"""
+
+    status_code = 429
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Embeddings derived from a hash of the text, so equal texts always get
+    equal vectors. Can simulate per-request latency and rate limiting.
+    """
+
+    def __init__(self, size=64, latency=0.0, rate_limit_every=0):
+        """
+        Args:
+            size: Embedding dimension
+            latency: Seconds each embeddings request takes
+            rate_limit_every: Fail every Nth request with a 429 (0 disables)
+        """
+        self.size = size
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.requests = 0
+        self.texts_embedded = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+        return np.random.default_rng(seed).standard_normal(self.size).tolist()
+
+    def _request(self, count):
+        with self._lock:
+            self.requests += 1
+            failing = self.rate_limit_every and self.requests % self.rate_limit_every == 0
+            if not failing:
+                self.texts_embedded += count
+        if self.latency:
+            time.sleep(self.latency)
+        if failing:
+            raise FakeRateLimitError("Rate limit reached (simulated 429)")
+
+    def embed_documents(self, texts):
+        self._request(len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self._request(1)
+        return self._vector(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers every prompt with the same text after a
+    configurable delay, streaming it word by word.
+    """
+
+    response: str = "Stay hungry, stay foolish. Focus on the few things that matter and make them great."
+    latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _tokens(self):
+        words = self.response.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def _message(self, messages):
+        prompt_tokens = sum(len(str(message.content).split()) for message in messages)
+        completion_tokens = len(self._tokens())
+        return AIMessage(
+            content=self.response,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency + self.token_latency * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for token in self._tokens():
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency + self.token_latency * len(self._tokens()))
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for token in self._tokens():
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
@@ -0,0 +1,52 @@
+"""
+Inter-process file lock used to serialize writes to the vector store
+"""
+
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to no locking
+    fcntl = None
+
+
+class FileLock:
+    """
+    Exclusive advisory lock on a file, held for the duration of a with-block.
+
+    Works across processes (e.g. gunicorn workers) as well as threads, since
+    every acquisition opens its own file description.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Path of the lock file (created if missing)
+        """
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        """Block until the lock is held"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a")
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+
+    def release(self):
+        """Release the lock"""
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
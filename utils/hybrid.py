@@ -0,0 +1,186 @@
+"""
+Hybrid lexical + dense retrieval
+
+A BM25 inverted index over the chunks in the vector store is built in
+process at setup. Queries are answered by fusing the BM25 and vector
+search rankings with reciprocal rank fusion (RRF). When the BM25 hit is
+strong enough on its own (the top chunk holds nearly all of the query's
+informative terms), the query is served lexically without calling the
+embeddings API at all.
+"""
+
+import os
+import re
+import math
+from collections import Counter
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils import metrics
+
+# Candidates taken from each ranking before fusion, as a multiple of k
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "3"))
+# RRF damping constant; 60 is the value from the original paper
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Share of the query's (idf-weighted) terms the top BM25 chunk must contain
+# to skip the embeddings call; above 1 disables the fast path
+LEXICAL_FAST_PATH_COVERAGE = float(os.getenv("LEXICAL_FAST_PATH_COVERAGE", "0.8"))
+LEXICAL_FAST_PATH_MIN_TERMS = int(os.getenv("LEXICAL_FAST_PATH_MIN_TERMS", "2"))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has
+have having he her here hers herself him himself his how i if in into is it its itself just me
+more most my myself no nor not now of off on once only or other our ours ourselves out over own
+same she should so some such than that the their theirs them themselves then there these they
+this those through to too under until up very was we were what when where which while who whom
+why will with would you your yours yourself yourselves i'm you're it's don't
+mean tell please really
+""".split())
+
+
+def tokenize(text):
+    """
+    Index terms of a text: lowercased words without stopwords, plus
+    bigrams of neighbouring words so exact phrases rank higher
+    """
+    words = [word for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+class BM25Index:
+    """In-memory BM25 inverted index"""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        """
+        Args:
+            documents: Documents to index, each with a chunk_id in its metadata
+            k1: Term frequency saturation
+            b: Length normalization
+        """
+        self.documents = list(documents)
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = []
+
+        for position, document in enumerate(self.documents):
+            terms = Counter(tokenize(document.page_content))
+            self.lengths.append(sum(terms.values()))
+            for term, count in terms.items():
+                self.postings.setdefault(term, []).append((position, count))
+
+        count = len(self.documents)
+        self.average_length = sum(self.lengths) / count if count else 0.0
+        self.idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+        # Weight for terms that appear in no document
+        self.unseen_idf = math.log(1 + (count + 0.5) / 0.5)
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        """Index every chunk stored in a vector store"""
+        records = vectorstore.get(include=["documents", "metadatas"])
+        documents = []
+        for chunk_id, text, metadata in zip(records["ids"], records["documents"], records["metadatas"]):
+            metadata = dict(metadata or {})
+            metadata.setdefault("chunk_id", chunk_id)
+            documents.append(Document(page_content=text, metadata=metadata))
+        return cls(documents)
+
+    def __len__(self):
+        return len(self.documents)
+
+    def search(self, query, k=4):
+        """
+        Top documents for a query
+
+        Returns:
+            (list of (Document, score), coverage) where coverage is the
+            idf-weighted share of the query's terms found in the top document
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.documents:
+            return [], 0.0
+
+        scores = {}
+        for term in terms:
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for position, count in self.postings[term]:
+                length_norm = 1 - self.b + self.b * self.lengths[position] / self.average_length
+                scores[position] = scores.get(position, 0.0) + idf * count * (self.k1 + 1) / (count + self.k1 * length_norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        if not ranked:
+            return [], 0.0
+
+        # Coverage is judged on single words; bigrams only sharpen the ranking
+        words = [term for term in terms if " " not in term]
+        top_terms = set(tokenize(self.documents[ranked[0][0]].page_content))
+        total = sum(self.idf.get(word, self.unseen_idf) for word in words)
+        matched = sum(self.idf[word] for word in words if word in top_terms)
+        coverage = matched / total if total and len(words) >= LEXICAL_FAST_PATH_MIN_TERMS else 0.0
+
+        return [(self.documents[position], score) for position, score in ranked], coverage
+
+
+def chunk_key(document):
+    return document.metadata.get("chunk_id") or document.page_content
+
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=RRF_K):
+    """Merge ranked document lists, scoring each document by sum(1 / (rrf_k + rank))"""
+    scores = {}
+    documents = {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = chunk_key(document)
+            documents.setdefault(key, document)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 + vector search fused with RRF, with a lexical-only fast path"""
+
+    vectorstore: object
+    index: object
+    personality_id: str = ""
+    k: int = 4
+
+    def _lexical(self, query):
+        """BM25 ranking, and whether it is strong enough to use on its own"""
+        ranked, coverage = self.index.search(query, k=self.k * HYBRID_CANDIDATES)
+        lexical = [document for document, _ in ranked]
+        return lexical, coverage >= LEXICAL_FAST_PATH_COVERAGE
+
+    def answers_lexically(self, query):
+        """True if the query is served by BM25 alone, without an embeddings call"""
+        return self._lexical(query)[1]
+
+    def _fuse(self, lexical, dense):
+        path = "hybrid" if lexical else "dense"
+        metrics.record_retrieval(self.personality_id, path)
+        return reciprocal_rank_fusion([dense, lexical], self.k)
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        lexical, strong = self._lexical(query)
+        if strong:
+            metrics.record_retrieval(self.personality_id, "lexical")
+            return lexical[:self.k]
+        dense = self.vectorstore.similarity_search(query, k=self.k * HYBRID_CANDIDATES)
+        return self._fuse(lexical, dense)
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        lexical, strong = self._lexical(query)
+        if strong:
+            metrics.record_retrieval(self.personality_id, "lexical")
+            return lexical[:self.k]
+        dense = await self.vectorstore.asimilarity_search(query, k=self.k * HYBRID_CANDIDATES)
+        return self._fuse(lexical, dense)
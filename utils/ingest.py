@@ -0,0 +1,122 @@
+"""
+Bulk ingest: embed chunks in concurrent batches and write them to a vector store
+"""
+
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.scheduler import retry_scope
+
+# Defaults for the index-build path, tunable per deployment
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+# Retries of a failed embeddings batch, in place of UPSTREAM_RETRIES: a
+# large rebuild rides out longer rate limiting than a chat request should
+INGEST_RETRIES = int(os.getenv("INGEST_RETRIES", "6"))
+
+
+def write_embeddings(vectorstore, ids, chunks, vectors):
+    """Write precomputed embeddings to a vector store (numpy or Chroma) without re-embedding"""
+    vectorstore.add_embeddings(
+        texts=[chunk.page_content for chunk in chunks],
+        embeddings=vectors,
+        metadatas=[chunk.metadata for chunk in chunks],
+        ids=ids
+    )
+
+
+def deferred_writes(vectorstore):
+    """Context in which a store that supports it saves its writes once, at the end"""
+    if hasattr(vectorstore, "deferred_writes"):
+        return vectorstore.deferred_writes()
+    return nullcontext()
+
+
+class BulkIngestor:
+    """
+    Embeds chunks in batches on a bounded worker pool.
+
+    Rate limits and transient errors are retried by the upstream scheduler
+    (utils.scheduler) that every embeddings call goes through, not here;
+    batches get INGEST_RETRIES retries there instead of UPSTREAM_RETRIES.
+    Each batch is written to the vector store as soon as it is embedded, so a crash
+    only loses the batches still in flight. Stores that rewrite themselves
+    on every write (the numpy store) save once at the end instead, or when
+    a batch fails; their batches are only reported to on_batch once saved.
+    """
+
+    def __init__(self, embeddings, batch_size=INGEST_BATCH_SIZE, max_workers=INGEST_WORKERS,
+                 retries=INGEST_RETRIES):
+        """
+        Args:
+            embeddings: Embeddings model used to embed chunks
+            batch_size: Chunks per embeddings request
+            max_workers: Maximum concurrent embeddings requests
+            retries: Retries the upstream scheduler allows each batch
+        """
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.retries = retries
+
+    def embed_batch(self, texts):
+        """Embed one batch"""
+        with retry_scope(self.retries):
+            return self.embeddings.embed_documents(texts)
+
+    def ingest(self, vectorstore, chunks, ids, on_batch=None):
+        """
+        Embed and store chunks
+
+        Args:
+            vectorstore: Vector store to write to
+            chunks: Documents to embed
+            ids: Id for each chunk
+            on_batch: Optional callback(ids, chunks) run after each batch is stored
+
+        Returns:
+            dict with 'chunks', 'batches', 'seconds' and 'chunks_per_sec'
+        """
+        start = time.perf_counter()
+        batches = [
+            (ids[i:i + self.batch_size], chunks[i:i + self.batch_size])
+            for i in range(0, len(chunks), self.batch_size)
+        ]
+
+        done = 0
+        deferred = hasattr(vectorstore, "deferred_writes")
+        stored = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingest") as executor, \
+                    deferred_writes(vectorstore):
+                futures = {
+                    executor.submit(self.embed_batch, [chunk.page_content for chunk in batch_chunks]): (batch_ids, batch_chunks)
+                    for batch_ids, batch_chunks in batches
+                }
+                # Writes stay on this thread so the store only ever has one writer
+                for future in as_completed(futures):
+                    batch_ids, batch_chunks = futures[future]
+                    write_embeddings(vectorstore, batch_ids, batch_chunks, future.result())
+                    done += len(batch_chunks)
+                    if deferred:
+                        stored.append((batch_ids, batch_chunks))
+                    elif on_batch is not None:
+                        on_batch(batch_ids, batch_chunks)
+                    print(f"Embedded {done}/{len(chunks)} chunks")
+        finally:
+            # The store has saved these by now, even if a later batch failed
+            if on_batch is not None:
+                for batch_ids, batch_chunks in stored:
+                    on_batch(batch_ids, batch_chunks)
+
+        seconds = time.perf_counter() - start
+        stats = {
+            "chunks": len(chunks),
+            "batches": len(batches),
+            "seconds": round(seconds, 3),
+            "chunks_per_sec": round(len(chunks) / seconds, 1) if seconds > 0 else 0.0
+        }
+        print(f"Ingested {stats['chunks']} chunks in {stats['seconds']}s "
+              f"({stats['chunks_per_sec']} chunks/sec)")
+        return stats
@@ -0,0 +1,236 @@
+"""
+In-process metrics with Prometheus text exposition, plus per-request stage timing
+"""
+
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a cache hit to a slow LLM call
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = [
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in pairs
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+                for key, value in sorted(self._values.items())
+            ]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    labels = _format_labels(self.labelnames, key, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {series['sum']}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+STAGE_DURATION = Histogram(
+    "wwts_stage_duration_seconds",
+    "Time spent in each stage of answering a chat message",
+    labelnames=("personality_id", "stage")
+)
+LLM_TOKENS = Histogram(
+    "wwts_llm_tokens",
+    "Tokens per LLM call",
+    labelnames=("personality_id", "kind"),
+    buckets=TOKEN_BUCKETS
+)
+CACHE_LOOKUPS = Counter(
+    "wwts_response_cache_lookups_total",
+    "Response cache lookups by result",
+    labelnames=("personality_id", "result")
+)
+ERRORS = Counter(
+    "wwts_errors_total",
+    "Failed chat requests",
+    labelnames=("personality_id", "stage")
+)
+
+RETRIEVALS = Counter(
+    "wwts_retrievals_total",
+    "Retrievals by path: lexical (BM25 only, no embedding), hybrid, dense or cached (retrieval cache)",
+    labelnames=("personality_id", "path")
+)
+
+PROMPT_TOKENS = Histogram(
+    "wwts_prompt_tokens",
+    "Estimated tokens per RAG prompt, in total and for the retrieved context",
+    labelnames=("personality_id", "part"),
+    buckets=TOKEN_BUCKETS
+)
+CONTEXT_CHUNKS = Counter(
+    "wwts_context_chunks_total",
+    "Retrieved chunks by what context assembly did with them: used, trimmed or dropped",
+    labelnames=("personality_id", "outcome")
+)
+
+UPSTREAM_EVENTS = Counter(
+    "wwts_upstream_events_total",
+    "Upstream scheduling events: throttled, rate_limited, deadline_exceeded or coalesced",
+    labelnames=("event",)
+)
+
+REGISTRY = [
+    STAGE_DURATION, LLM_TOKENS, CACHE_LOOKUPS, ERRORS, RETRIEVALS, PROMPT_TOKENS, CONTEXT_CHUNKS, UPSTREAM_EVENTS
+]
+
+# Stage timings of the request being handled, when the client asked for them
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def observe_stage(personality_id, stage, seconds):
+    """Record how long a stage took"""
+    STAGE_DURATION.observe(seconds, personality_id=personality_id, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def stage(personality_id, name):
+    """Time the enclosed block as one stage of a request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(personality_id, name, time.perf_counter() - start)
+
+
+def timed_stream(personality_id, chunks):
+    """
+    Turn a chat model stream into token events, timing the first token
+    ('llm_first_token') and the whole generation ('llm')
+    """
+    start = time.perf_counter()
+    first = True
+    for chunk in chunks:
+        if chunk.content:
+            if first:
+                observe_stage(personality_id, "llm_first_token", time.perf_counter() - start)
+                first = False
+            yield {"type": "token", "content": chunk.content}
+    observe_stage(personality_id, "llm", time.perf_counter() - start)
+
+
+def record_usage(personality_id, message):
+    """Record the token counts reported on an LLM response, if any"""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    LLM_TOKENS.observe(usage.get("input_tokens", 0), personality_id=personality_id, kind="prompt")
+    LLM_TOKENS.observe(usage.get("output_tokens", 0), personality_id=personality_id, kind="completion")
+
+
+def record_prompt_tokens(personality_id, packed):
+    """Record the size of an assembled prompt (see utils.context.pack_context)"""
+    PROMPT_TOKENS.observe(packed["prompt_tokens"], personality_id=personality_id, part="total")
+    PROMPT_TOKENS.observe(packed["tokens"], personality_id=personality_id, part="context")
+    CONTEXT_CHUNKS.inc(len(packed["documents"]), personality_id=personality_id, outcome="used")
+    CONTEXT_CHUNKS.inc(packed["trimmed"], personality_id=personality_id, outcome="trimmed")
+    CONTEXT_CHUNKS.inc(packed["dropped"], personality_id=personality_id, outcome="dropped")
+
+
+def record_cache_lookup(personality_id, hit):
+    CACHE_LOOKUPS.inc(personality_id=personality_id, result="hit" if hit else "miss")
+
+
+def record_error(personality_id, stage_name):
+    ERRORS.inc(personality_id=personality_id, stage=stage_name)
+
+
+def record_retrieval(personality_id, path):
+    RETRIEVALS.inc(personality_id=personality_id, path=path)
+
+
+def record_upstream_event(event):
+    UPSTREAM_EVENTS.inc(event=event)
+
+
+@contextmanager
+def collect_timings():
+    """Collect the stages timed on this thread into a list, for one request"""
+    timings = []
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def server_timing_header(timings):
+    """Format collected stage timings as a Server-Timing header value"""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
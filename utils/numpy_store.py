@@ -0,0 +1,255 @@
+"""
+Lightweight local vector store: a memory-mapped NumPy matrix of normalized
+embeddings with a parallel array of document records
+"""
+
+import os
+import json
+import uuid
+import shutil
+import threading
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.json"
+# Names the version directory holding the current matrix and records
+CURRENT_FILE = "CURRENT"
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact cosine search over a few thousand chunks without a database.
+
+    Embeddings are L2-normalized and saved as one float32 (or float16) .npy
+    matrix that is memory-mapped read-only, so every process on the host
+    shares the same page-cached copy. Ids, texts and metadata live in a JSON
+    file whose rows line up with the matrix.
+
+    Every save writes both files to a new version directory and then points
+    CURRENT at it, so readers (and a crash) only ever see a matching pair.
+    Saves rewrite the whole index, which is fine for the small, rarely
+    rebuilt per-personality indexes this app uses; bulk writes go through
+    deferred_writes() so an ingest saves once instead of once per batch.
+    """
+
+    def __init__(self, embedding_function, persist_directory, dtype="float32", mmap=True):
+        """
+        Args:
+            embedding_function: Embeddings model used for queries and new texts
+            persist_directory: Directory holding the matrix and records
+            dtype: 'float32' or 'float16' storage for the matrix
+            mmap: Memory-map the matrix instead of reading it into memory
+        """
+        self.embedding_function = embedding_function
+        self.persist_directory = persist_directory
+        self.dtype = np.dtype(dtype)
+        self.mmap = mmap
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._records = {"ids": [], "texts": [], "metadatas": []}
+        self._deferred = 0
+        self._dirty = False
+        self._load()
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    @staticmethod
+    def current_directory(persist_directory):
+        """Directory of the current matrix and records, or None if nothing has been written"""
+        try:
+            with open(os.path.join(persist_directory, CURRENT_FILE)) as f:
+                return os.path.join(persist_directory, f.read().strip())
+        except FileNotFoundError:
+            pass
+        # Stores written before versioning keep both files at the top level
+        if (os.path.exists(os.path.join(persist_directory, EMBEDDINGS_FILE))
+                and os.path.exists(os.path.join(persist_directory, RECORDS_FILE))):
+            return persist_directory
+        return None
+
+    @classmethod
+    def exists(cls, persist_directory):
+        """True if a store has been written to the directory"""
+        return cls.current_directory(persist_directory) is not None
+
+    def _load(self):
+        # A writer may replace the version between reading CURRENT and opening it
+        for attempt in range(3):
+            directory = self.current_directory(self.persist_directory)
+            if directory is None:
+                return
+            try:
+                with open(os.path.join(directory, RECORDS_FILE)) as f:
+                    records = json.load(f)
+                matrix = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r" if self.mmap else None)
+                break
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+        # Swap both in at once so concurrent searches see a consistent pair
+        self._matrix, self._records = matrix, records
+
+    def _save(self, matrix, records):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        previous = self.current_directory(self.persist_directory)
+        version = f"v-{uuid.uuid4().hex[:12]}"
+        directory = os.path.join(self.persist_directory, version)
+        os.makedirs(directory)
+        with open(os.path.join(directory, EMBEDDINGS_FILE), "wb") as f:
+            np.save(f, matrix)
+        with open(os.path.join(directory, RECORDS_FILE), "w") as f:
+            json.dump(records, f)
+
+        # Readers switch to the new pair with this one rename
+        current_path = os.path.join(self.persist_directory, CURRENT_FILE)
+        tmp_path = f"{current_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(version)
+        os.replace(tmp_path, current_path)
+        self._load()
+        self._remove_old_versions(keep={directory, previous})
+
+    def _remove_old_versions(self, keep):
+        """Delete versions older than the previous one (processes that mapped them keep their copy)"""
+        for name in os.listdir(self.persist_directory):
+            path = os.path.join(self.persist_directory, name)
+            if name.startswith("v-") and os.path.isdir(path) and path not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+        if self.persist_directory not in keep:
+            for name in (EMBEDDINGS_FILE, RECORDS_FILE):
+                try:
+                    os.remove(os.path.join(self.persist_directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def _write(self, matrix, records):
+        """Save a new matrix and records, or only keep them in memory while writes are deferred (caller holds the lock)"""
+        if self._deferred:
+            self._matrix, self._records = matrix, records
+            self._dirty = True
+        else:
+            self._save(matrix, records)
+
+    @contextmanager
+    def deferred_writes(self):
+        """Keep writes made in the block in memory and save them once when it ends"""
+        with self._lock:
+            self._deferred += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._deferred -= 1
+                if not self._deferred and self._dirty:
+                    self._save(self._matrix, self._records)
+                    self._dirty = False
+
+    def _normalize(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None):
+        """Add (or replace) documents with precomputed embeddings"""
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        if not texts:
+            return ids
+
+        new_vectors = self._normalize(embeddings).astype(self.dtype)
+
+        with self._lock:
+            replaced = set(ids)
+            keep = [i for i, existing in enumerate(self._records["ids"]) if existing not in replaced]
+            records = {
+                "ids": [self._records["ids"][i] for i in keep] + ids,
+                "texts": [self._records["texts"][i] for i in keep] + texts,
+                "metadatas": [self._records["metadatas"][i] for i in keep] + [dict(m or {}) for m in metadatas]
+            }
+            if self._matrix is not None and len(self._matrix):
+                matrix = np.concatenate([np.asarray(self._matrix[keep], dtype=self.dtype), new_vectors])
+            else:
+                matrix = new_vectors
+            self._write(matrix, records)
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        vectors = self.embedding_function.embed_documents(texts)
+        return self.add_embeddings(texts, vectors, metadatas=metadatas, ids=ids)
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return True
+        with self._lock:
+            removed = set(ids)
+            keep = [i for i, existing in enumerate(self._records["ids"]) if existing not in removed]
+            if len(keep) == len(self._records["ids"]):
+                return True
+            records = {key: [values[i] for i in keep] for key, values in self._records.items()}
+            matrix = np.asarray(self._matrix[keep], dtype=self.dtype)
+            self._write(matrix, records)
+        return True
+
+    def get(self, ids=None, include=None):
+        """Stored records, in the same shape as Chroma's get()"""
+        records = self._records
+        rows = range(len(records["ids"]))
+        if ids is not None:
+            wanted = set(ids)
+            rows = [i for i in rows if records["ids"][i] in wanted]
+        return {
+            "ids": [records["ids"][i] for i in rows],
+            "documents": [records["texts"][i] for i in rows],
+            "metadatas": [records["metadatas"][i] for i in rows]
+        }
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4):
+        """Top-k documents by cosine similarity to an embedding"""
+        matrix, records = self._matrix, self._records
+        if matrix is None or not len(matrix):
+            return []
+
+        query = self._normalize(embedding)
+        # float16 matrices are upcast here so scores accumulate in float32
+        scores = np.asarray(matrix @ query, dtype=np.float32)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            (Document(
+                id=records["ids"][i],
+                page_content=records["texts"][i],
+                metadata=dict(records["metadatas"][i])
+            ), float(scores[i]))
+            for i in top
+        ]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k=k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, persist_directory="vector_store",
+                   **kwargs):
+        store = cls(embedding, persist_directory, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -3,150 +3,597 @@ RAG Pipeline utilities for document loading, chunking, embedding, and retrieval
 """
 
 import os
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain_openai import ChatOpenAI
-from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
+import json
+import hashlib
 from dotenv import load_dotenv
+from utils.embedding_cache import CachedEmbeddings
+from utils.clients import SharedEmbeddings, get_chat_model
+from utils.file_lock import FileLock
+from utils.ingest import BulkIngestor
+from utils.corpus import resolve_sources, iter_documents, source_title
+from utils import metrics
+from utils.scheduler import upstream, within_deadline
+from utils.conversation import add_history, trim_history
+from utils.chunking import CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from utils.tokens import count_tokens, tokenizer_name, require_encoding
+from utils.context import PROMPT_TOKEN_BUDGET, CONTEXT_CANDIDATES, CONTEXT_MIN_TOKENS, template_tokens
+from utils.retrieval_cache import Retrieval, RetrievalCache
 
 # Load environment variables
 load_dotenv()
 
+# Root directory of the per-personality vector stores
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "vector_store")
+
+# Query/chunk embeddings kept in memory, whether to persist them to disk,
+# and how many to keep there
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_DISK = os.getenv("EMBEDDING_CACHE_DISK", "1") == "1"
+EMBEDDING_CACHE_DISK_ROWS = int(os.getenv("EMBEDDING_CACHE_DISK_ROWS", "20000"))
+
+# Version of the index manifest format
+MANIFEST_VERSION = 1
+
+# Vector store backend: 'chroma', or 'numpy' for the memory-mapped local index
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# Storage precision of the numpy backend: 'float32' or 'float16'
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+
+# 'sentence' packs whole sentences into CHUNK_TOKENS-token chunks (see
+# utils/chunking.py); 'recursive' is the original 1000-character splitter
+CHUNKER = os.getenv("CHUNKER", "sentence")
+
+# 'hybrid' fuses BM25 with vector search (see utils/hybrid.py); 'dense' is vector search only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+
+
+def create_embeddings(persist_directory=VECTOR_STORE_DIR):
+    """Create the shared embeddings client wrapped in the embedding cache"""
+    return CachedEmbeddings(
+        SharedEmbeddings(),
+        max_size=EMBEDDING_CACHE_SIZE,
+        cache_dir=persist_directory if EMBEDDING_CACHE_DISK else None,
+        max_disk_rows=EMBEDDING_CACHE_DISK_ROWS
+    )
+
+
 class RAGPipeline:
-    def __init__(self, personality_id, documents_path, persist_directory="vector_store"):
+    def __init__(self, personality_id, documents_path, persist_directory=VECTOR_STORE_DIR, llm=None,
+                 embeddings=None, backend=None, retrieval_cache=None, suggested_prompts=()):
         """
         Initialize RAG pipeline for a specific personality
 
         Args:
             personality_id: ID of the personality (e.g., 'steve_jobs')
-            documents_path: Path to the document(s) to load
+            documents_path: Path, directory or glob of the document(s) to load,
+                or a list of them (PDF, text, markdown or JSONL transcripts)
             persist_directory: Directory to persist vector store
+            llm: Optional chat model to use instead of the shared one from the client registry
+            embeddings: Optional embeddings model, defaults to the cached shared embeddings
+            backend: Vector store backend, 'chroma' or 'numpy' (defaults to VECTOR_BACKEND)
+            retrieval_cache: Optional RetrievalCache shared with other pipelines
+            suggested_prompts: Questions whose retrievals setup() caches ahead of time
         """
         self.personality_id = personality_id
         self.documents_path = documents_path
         self.persist_directory = os.path.join(persist_directory, personality_id)
-        self.embeddings = OpenAIEmbeddings()
+        self.embeddings = embeddings if embeddings is not None else create_embeddings(persist_directory)
+        self.backend = backend or VECTOR_BACKEND
+        if self.backend not in ("chroma", "numpy"):
+            raise ValueError(f"Unknown vector store backend: {self.backend}")
+        # Both backends can live in the same directory, each with its own manifest
+        manifest_name = "index_manifest.json" if self.backend == "chroma" else f"index_manifest.{self.backend}.json"
+        self.manifest_path = os.path.join(self.persist_directory, manifest_name)
+        self.chunker = CHUNKER
+        if self.chunker not in ("sentence", "recursive"):
+            raise ValueError(f"Unknown chunker: {self.chunker}")
+        if self.chunker == "sentence":
+            # Sizes in tokens
+            self.chunk_size = CHUNK_TOKENS
+            self.chunk_overlap = CHUNK_OVERLAP_TOKENS
+        else:
+            # Sizes in characters
+            self.chunk_size = 1000
+            self.chunk_overlap = 200
+        self.ingestor = BulkIngestor(self.embeddings)
+        self.last_ingest_stats = None
+        self.llm = llm
         self.vectorstore = None
+        self.lexical_index = None
         self.retriever = None
+        self.retrieval_cache = retrieval_cache if retrieval_cache is not None else RetrievalCache()
+        self.suggested_prompts = list(suggested_prompts)
+        self.k = CONTEXT_CANDIDATES
+        self.index_version = None
+
+    def lazy_load_documents(self):
+        """Stream documents from every source file"""
+        paths = self.source_paths()
+        if not paths:
+            raise ValueError(f"No source documents found for {self.personality_id}")
+        return iter_documents(paths)
 
     def load_documents(self):
-        """Load documents from PDF"""
+        """Load documents from every source file"""
         print(f"Loading documents from {self.documents_path}...")
-        loader = PyPDFLoader(self.documents_path)
-        documents = loader.load()
+        documents = list(self.lazy_load_documents())
         print(f"Loaded {len(documents)} pages")
         return documents
 
     def split_documents(self, documents):
-        """Split documents into chunks"""
+        """Split documents into chunks, recording each chunk's token count in its metadata"""
         print("Splitting documents into chunks...")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
-        chunks = text_splitter.split_documents(documents)
-        print(f"Created {len(chunks)} chunks")
+        if self.chunker == "sentence":
+            # Chunk boundaries depend on the tokenizer, so never build them from estimates by accident
+            require_encoding()
+            from utils.chunking import split_documents
+            chunks = split_documents(documents, self.chunk_size, self.chunk_overlap)
+        else:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                length_function=len,
+            )
+            chunks = text_splitter.split_documents(documents)
+            for chunk in chunks:
+                chunk.metadata["token_count"] = count_tokens(chunk.page_content)
+        tokens = sum(chunk.metadata["token_count"] for chunk in chunks)
+        print(f"Created {len(chunks)} chunks ({tokens} tokens)")
         return chunks
 
-    def create_vectorstore(self, chunks):
+    def splitter_params(self):
+        """
+        Parameters that change how documents are chunked
+
+        The sentence chunker's include the configured tokenizer (not whether
+        it happened to load), so every process agrees on the index.
+        """
+        if self.chunker == "sentence":
+            return {
+                "splitter": "sentence_token",
+                "chunk_tokens": self.chunk_size,
+                "overlap_tokens": self.chunk_overlap,
+                "tokenizer": tokenizer_name()
+            }
+        return {
+            "splitter": "recursive_character",
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap
+        }
+
+    def source_paths(self):
+        """Paths of the source documents"""
+        return resolve_sources(self.documents_path)
+
+    def fingerprint_sources(self):
+        """Content hash of every source document"""
+        fingerprints = {}
+        for path in self.source_paths():
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            fingerprints[path] = digest.hexdigest()
+        return fingerprints
+
+    def assign_chunk_ids(self, chunks):
+        """
+        Give every chunk a stable id derived from its content
+
+        The id covers the source path, page, chunk text and splitter params,
+        so an unchanged chunk keeps its id across re-indexing. The id is
+        stored in the chunk metadata as 'chunk_id'.
+
+        Returns:
+            List of chunk ids, in chunk order
+        """
+        params = json.dumps(self.splitter_params(), sort_keys=True)
+        ids = []
+        seen = {}
+        for chunk in chunks:
+            text_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+            key = "|".join([
+                str(chunk.metadata.get("source", "")),
+                str(chunk.metadata.get("page", "")),
+                text_hash,
+                params
+            ])
+            chunk_id = hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+            # Identical text on the same page gets an occurrence suffix
+            occurrence = seen.get(chunk_id, 0)
+            seen[chunk_id] = occurrence + 1
+            if occurrence:
+                chunk_id = f"{chunk_id}-{occurrence}"
+
+            chunk.metadata["chunk_id"] = chunk_id
+            ids.append(chunk_id)
+        return ids
+
+    def load_manifest(self):
+        """Load the index manifest, or None if there is no valid one"""
+        if not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != MANIFEST_VERSION:
+            return None
+        return manifest
+
+    def save_manifest(self, manifest):
+        """Atomically write the index manifest"""
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def chunk_record(self, chunk):
+        """Manifest entry for an indexed chunk"""
+        return {
+            "source": chunk.metadata.get("source"),
+            "page": chunk.metadata.get("page"),
+            "hash": hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()
+        }
+
+    def create_vectorstore(self, chunks, ids=None):
         """Create and persist vector store"""
         print("Creating vector store with embeddings...")
-        self.vectorstore = Chroma.from_documents(
-            documents=chunks,
-            embedding=self.embeddings,
-            persist_directory=self.persist_directory
-        )
+        self.load_vectorstore()
+        if ids is None:
+            ids = self.assign_chunk_ids(chunks)
+        self.last_ingest_stats = self.ingestor.ingest(self.vectorstore, chunks, ids)
         print(f"Vector store created and persisted to {self.persist_directory}")
         return self.vectorstore
 
+    def vectorstore_exists(self):
+        """True if the vector store for this backend has been written"""
+        if self.backend == "numpy":
+            from utils.numpy_store import NumpyVectorStore
+            return NumpyVectorStore.exists(self.persist_directory)
+        return os.path.exists(os.path.join(self.persist_directory, "chroma.sqlite3"))
+
     def load_vectorstore(self):
         """Load existing vector store"""
         print(f"Loading vector store from {self.persist_directory}...")
-        self.vectorstore = Chroma(
-            persist_directory=self.persist_directory,
-            embedding_function=self.embeddings
-        )
+        if self.backend == "numpy":
+            from utils.numpy_store import NumpyVectorStore
+            self.vectorstore = NumpyVectorStore(
+                self.embeddings,
+                self.persist_directory,
+                dtype=VECTOR_DTYPE
+            )
+        else:
+            # Chroma is slow to import, so only pay for it when it is used
+            from utils.chroma_store import ChromaVectorStore
+            self.vectorstore = ChromaVectorStore(self.embeddings, self.persist_directory)
         return self.vectorstore
 
-    def get_retriever(self, k=4):
-        """Get retriever from vector store"""
+    def get_retriever(self, k=CONTEXT_CANDIDATES):
+        """
+        Get retriever from vector store
+
+        k is the number of candidate chunks; build_prompt keeps as many of
+        them as fit the prompt's token budget. In hybrid mode this also
+        (re)builds the BM25 index from the chunks currently in the store.
+        """
         if self.vectorstore is None:
             # Try to load existing vectorstore
-            if os.path.exists(self.persist_directory):
+            if self.vectorstore_exists():
                 self.load_vectorstore()
             else:
                 raise ValueError("Vector store not initialized. Run setup() first.")
 
-        self.retriever = self.vectorstore.as_retriever(
-            search_kwargs={"k": k}
-        )
+        self.k = k
+        if RETRIEVAL_MODE == "hybrid":
+            from utils.hybrid import BM25Index, HybridRetriever
+            self.lexical_index = BM25Index.from_vectorstore(self.vectorstore)
+            self.retriever = HybridRetriever(
+                vectorstore=self.vectorstore,
+                index=self.lexical_index,
+                personality_id=self.personality_id,
+                k=k
+            )
+        else:
+            self.retriever = self.vectorstore.as_retriever(
+                search_kwargs={"k": k}
+            )
         return self.retriever
 
+    def update_index(self, manifest):
+        """
+        Bring the vector store in line with the source documents
+
+        Only chunks whose id is not in the manifest are embedded, and chunks
+        that no longer exist are deleted, so editing one page of a source
+        only re-embeds that page.
+        """
+        documents = self.load_documents()
+        chunks = self.split_documents(documents)
+        ids = self.assign_chunk_ids(chunks)
+
+        indexed = {}
+        existed = self.vectorstore_exists()
+        self.load_vectorstore()
+        if existed:
+            if manifest is None:
+                # Store built without a manifest: its ids are unknown, so start over
+                stale_ids = self.vectorstore.get(include=[])["ids"]
+                if stale_ids:
+                    print(f"Dropping {len(stale_ids)} chunks indexed without a manifest")
+                    self.vectorstore.delete(ids=stale_ids)
+            else:
+                indexed = dict(manifest["chunks"])
+
+        current = set(ids)
+        removed = [chunk_id for chunk_id in indexed if chunk_id not in current]
+        if removed:
+            self.vectorstore.delete(ids=removed)
+            for chunk_id in removed:
+                del indexed[chunk_id]
+
+        added = [(chunk_id, chunk) for chunk_id, chunk in zip(ids, chunks) if chunk_id not in indexed]
+
+        # Checkpoint after every stored batch. Source fingerprints are only
+        # recorded once the run completes, so a crashed build is picked up by
+        # the next setup() and resumes with the chunks that are still missing.
+        checkpoint = {
+            "version": MANIFEST_VERSION,
+            "splitter": self.splitter_params(),
+            "sources": {},
+            "chunks": indexed
+        }
+        self.save_manifest(checkpoint)
+
+        def on_batch(batch_ids, batch_chunks):
+            for chunk_id, chunk in zip(batch_ids, batch_chunks):
+                indexed[chunk_id] = self.chunk_record(chunk)
+            self.save_manifest(checkpoint)
+
+        if added:
+            self.last_ingest_stats = self.ingestor.ingest(
+                self.vectorstore,
+                [chunk for _, chunk in added],
+                [chunk_id for chunk_id, _ in added],
+                on_batch=on_batch
+            )
+        print(f"Index updated: {len(added)} chunks embedded, {len(removed)} removed, "
+              f"{len(ids) - len(added)} unchanged")
+
+        checkpoint["sources"] = self.fingerprint_sources()
+        self.save_manifest(checkpoint)
+
     def setup(self):
         """Complete setup: load, split, embed, and store documents"""
-        # Check if vectorstore already exists
-        if os.path.exists(self.persist_directory):
-            print(f"Vector store already exists for {self.personality_id}")
-            self.load_vectorstore()
-        else:
-            # Load and process documents
-            documents = self.load_documents()
-            chunks = self.split_documents(documents)
-            self.create_vectorstore(chunks)
+        # Hold the index lock so concurrent workers never build the same
+        # vector store at once; the others wait and then load the result
+        with FileLock(self.persist_directory + ".lock"):
+            manifest = self.load_manifest()
+            if (manifest is not None
+                    and manifest["splitter"] == self.splitter_params()
+                    and manifest["sources"] == self.fingerprint_sources()):
+                print(f"Vector store is up to date for {self.personality_id}")
+                self.load_vectorstore()
+            else:
+                # Embed new and changed chunks, drop removed ones
+                self.update_index(manifest)
+                manifest = self.load_manifest()
+
+        # Cached retrievals from any other version of the index are stale
+        self.index_version = self.manifest_version(manifest)
+        self.retrieval_cache.invalidate(self.personality_id, self.index_version)
 
         # Create retriever
         self.get_retriever()
+        self.warm_retrievals()
         print(f"RAG pipeline ready for {self.personality_id}")
         return self
 
-    def query(self, question, system_prompt_template):
-        """
-        Query the RAG pipeline
+    @staticmethod
+    def manifest_version(manifest):
+        """Version of an index: a hash of the ids of the chunks in it"""
+        if manifest is None:
+            return None
+        return hashlib.sha256("\n".join(sorted(manifest["chunks"])).encode("utf-8")).hexdigest()[:16]
 
-        Args:
-            question: User's question
-            system_prompt_template: Template with {context} and {question} placeholders
+    def warm_retrievals(self):
+        """Cache the retrievals for the suggested prompts, so clicking one only waits for the answer"""
+        warmed = 0
+        for question in self.suggested_prompts:
+            try:
+                self.retrieve(question)
+                warmed += 1
+            except Exception as e:
+                print(f"Error warming retrieval for {self.personality_id}: {str(e)}")
+                break
+        if warmed:
+            print(f"Cached retrievals for {warmed} suggested prompts of {self.personality_id}")
+        return warmed
+
+    def get_llm(self):
+        """Get the chat model used to answer questions"""
+        if self.llm is not None:
+            return self.llm
+        return get_chat_model(self.personality_id)
+
+    def embeds_question(self, question):
+        """True if retrieving for the question calls the embeddings API (not the hybrid fast path)"""
+        if self.retriever is None:
+            self.get_retriever()
+        if hasattr(self.retriever, "answers_lexically"):
+            return not self.retriever.answers_lexically(question)
+        return True
+
+    def retrieval_key(self, question):
+        """Retrieval cache key for a question against the current index"""
+        return RetrievalCache.key(self.personality_id, question, self.k, self.index_version)
+
+    def cached_retrieval(self, key):
+        """The cached retrieval for a key, or None"""
+        retrieval = self.retrieval_cache.get(key)
+        if retrieval is not None:
+            metrics.record_retrieval(self.personality_id, "cached")
+        return retrieval
+
+    def retrieve(self, question):
+        """
+        Retrieve the documents relevant to a question
 
         Returns:
-            dict with 'response' and 'sources'
+            A Retrieval (see utils/retrieval_cache.py), from the retrieval
+            cache when the question was asked before
         """
         if self.retriever is None:
             self.get_retriever()
 
-        # Retrieve relevant documents
-        relevant_docs = self.retriever.get_relevant_documents(question)
+        key = self.retrieval_key(question)
+        retrieval = self.cached_retrieval(key)
+        if retrieval is None:
+            retrieval = self.retrieval_cache.store(key, Retrieval(self.retriever.get_relevant_documents(question)))
+        return retrieval
+
+    def build_prompt(self, question, retrieval, system_prompt_template, history="", token_budget=None):
+        """
+        Format the system prompt with the retrieved context and conversation history
+
+        The retrieved chunks get whatever is left of the token budget after
+        the template, question and history (see utils/context.py). The
+        history's oldest turns are dropped when keeping them would leave the
+        chunks less than CONTEXT_MIN_TOKENS.
+
+        Args:
+            retrieval: The Retrieval returned by retrieve()
+            token_budget: Tokens for the whole prompt, defaults to PROMPT_TOKEN_BUDGET
 
-        # Format context from retrieved documents
-        context = "\n\n".join([doc.page_content for doc in relevant_docs])
+        Returns:
+            (prompt, packed): packed is the result of pack_context, plus
+            'sources', the sources payload for the chunks used, and
+            'prompt_tokens', the estimated size of the whole prompt
+        """
+        budget = token_budget or PROMPT_TOKEN_BUDGET
+        fixed_tokens = template_tokens(system_prompt_template) + count_tokens(question)
+        # A long conversation gives up its oldest turns before the context goes below its minimum
+        history = trim_history(history, budget - fixed_tokens - min(CONTEXT_MIN_TOKENS, max(0, budget - fixed_tokens)))
+        fixed_tokens += count_tokens(add_history("", history))
+        # Cached retrievals share their packed contexts, so copy before adding to it
+        packed = dict(retrieval.pack(max(0, budget - fixed_tokens), self.format_sources))
+        packed["prompt_tokens"] = fixed_tokens + packed["tokens"]
+        metrics.record_prompt_tokens(self.personality_id, packed)
 
-        # Format the prompt
         prompt = system_prompt_template.format(
-            context=context,
+            context=add_history(packed["context"], history),
             question=question
         )
+        return prompt, packed
 
-        # Get LLM response
-        llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
-        response = llm.invoke(prompt)
-
-        # Format sources
+    def format_sources(self, relevant_docs):
+        """Format retrieved documents as the sources returned to the client"""
         sources = []
         for i, doc in enumerate(relevant_docs):
             sources.append({
-                "title": f"Stanford Commencement Speech - Page {doc.metadata.get('page', i+1)}",
+                "title": f"{source_title(doc.metadata)} - Page {doc.metadata.get('page', i+1)}",
                 "excerpt": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
                 "page": doc.metadata.get('page', i+1)
             })
+        return sources
+
+    def query(self, question, system_prompt_template, history="", token_budget=None):
+        """
+        Query the RAG pipeline
+
+        Args:
+            question: User's question
+            system_prompt_template: Template with {context} and {question} placeholders
+            history: The conversation so far (see utils.conversation), if any
+            token_budget: Tokens for the whole prompt, defaults to PROMPT_TOKEN_BUDGET
+
+        Returns:
+            dict with 'response', 'sources' and 'prompt_tokens'
+        """
+        with metrics.stage(self.personality_id, "retrieve"):
+            retrieval = self.retrieve(question)
+        with metrics.stage(self.personality_id, "prompt"):
+            prompt, packed = self.build_prompt(question, retrieval, system_prompt_template, history, token_budget)
+
+        # Get LLM response
+        with metrics.stage(self.personality_id, "llm"):
+            response = upstream.call(self.get_llm().invoke, prompt, timeout_arg="timeout")
+        metrics.record_usage(self.personality_id, response)
 
         return {
             "response": response.content,
-            "sources": sources
+            "sources": packed["sources"],
+            "prompt_tokens": packed["prompt_tokens"]
         }
 
+    async def aretrieve(self, question):
+        """Retrieve the documents relevant to a question without blocking the event loop"""
+        if self.retriever is None:
+            self.get_retriever()
+
+        key = self.retrieval_key(question)
+        retrieval = self.cached_retrieval(key)
+        if retrieval is None:
+            # Embedding the question goes through the upstream scheduler itself
+            documents = await within_deadline(self.retriever.ainvoke(question))
+            retrieval = self.retrieval_cache.store(key, Retrieval(documents))
+        return retrieval
+
+    async def aquery(self, question, system_prompt_template, history="", token_budget=None):
+        """
+        Query the RAG pipeline from async code
+
+        Same result as query(); the LLM call waits for an upstream slot
+        from the admission controller and is cancelled at the deadline.
+        """
+        with metrics.stage(self.personality_id, "retrieve"):
+            retrieval = await self.aretrieve(question)
+        with metrics.stage(self.personality_id, "prompt"):
+            prompt, packed = self.build_prompt(question, retrieval, system_prompt_template, history, token_budget)
+
+        with metrics.stage(self.personality_id, "llm"):
+            response = await upstream.acall(self.get_llm().ainvoke, prompt)
+        metrics.record_usage(self.personality_id, response)
+
+        return {
+            "response": response.content,
+            "sources": packed["sources"],
+            "prompt_tokens": packed["prompt_tokens"]
+        }
+
+    def stream_query(self, question, system_prompt_template, history="", token_budget=None):
+        """
+        Query the RAG pipeline, streaming the answer as it is generated
+
+        Args:
+            question: User's question
+            system_prompt_template: Template with {context} and {question} placeholders
+            history: The conversation so far (see utils.conversation), if any
+            token_budget: Tokens for the whole prompt, defaults to PROMPT_TOKEN_BUDGET
+
+        Yields:
+            A 'sources' event with the sources used and the prompt's size in
+            tokens, then one 'token' event per chunk of the answer
+        """
+        with metrics.stage(self.personality_id, "retrieve"):
+            retrieval = self.retrieve(question)
+        with metrics.stage(self.personality_id, "prompt"):
+            prompt, packed = self.build_prompt(question, retrieval, system_prompt_template, history, token_budget)
+        yield {
+            "type": "sources",
+            "sources": packed["sources"],
+            "prompt_tokens": packed["prompt_tokens"]
+        }
+
+        yield from metrics.timed_stream(
+            self.personality_id,
+            upstream.stream(self.get_llm().stream, prompt, timeout_arg="timeout")
+        )
+
 
 def setup_personality_rag(personality_id, documents_path):
     """
@@ -181,7 +628,7 @@ if __name__ == "__main__":
     print("\n" + "="*50)
     print(f"Question: {test_question}")
     print("="*50)
-    print(f"Answer: {result['answer']}")
+    print(f"Answer: {result['response']}")
     print("\n" + "="*50)
     print("Sources:")
     for source in result['sources']:
@@ -0,0 +1,146 @@
+"""
+Semantic response cache shared by the RAG and system-prompt-only paths
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from utils.embedding_cache import normalize_text
+
+
+class ResponseCache:
+    """
+    Caches answers per personality and serves them for repeated or
+    near-duplicate questions.
+
+    An exact match on the normalized question is answered without touching
+    the embeddings API. Otherwise the question is embedded and compared with
+    the cached questions for the same personality; the closest one is used
+    when its cosine similarity reaches the threshold. Entries expire after a
+    TTL and the least recently used ones are evicted past max_entries.
+
+    Callers whose question embedding isn't reused elsewhere (personalities
+    without retrieval, questions retrieved lexically) can pass
+    semantic=False to match exact questions only and never embed. Answers are tied to the version of the index they
+    were retrieved from: once a personality is asked with another version,
+    its cached answers are dropped.
+    """
+
+    def __init__(self, embeddings, threshold=0.95, ttl=3600, max_entries=500):
+        """
+        Args:
+            embeddings: Embeddings model used to compare questions
+            threshold: Minimum cosine similarity for a semantic hit
+            ttl: Seconds an answer stays valid
+            max_entries: Maximum cached answers per personality
+        """
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(question):
+        """Exact-match key for a question"""
+        return hashlib.sha256(normalize_text(question).encode("utf-8")).hexdigest()
+
+    def _personality_entries(self, personality_id, version):
+        # Answers from another version of the index are stale
+        if self._versions.get(personality_id, version) != version:
+            self._entries.pop(personality_id, None)
+        self._versions[personality_id] = version
+        entries = self._entries.setdefault(personality_id, OrderedDict())
+
+        # Drop expired answers
+        now = time.monotonic()
+        for key in [key for key, entry in entries.items() if now - entry["created"] > self.ttl]:
+            del entries[key]
+        return entries
+
+    def _embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, personality_id, question, version=None, semantic=True):
+        """
+        Look up a cached answer
+
+        Args:
+            version: Version of the personality's index (None without one)
+            semantic: Also match near-duplicate questions, embedding this one
+
+        Returns:
+            The cached result dict, or None on a miss
+        """
+        key = self.key(question)
+        with self._lock:
+            entries = self._personality_entries(personality_id, version)
+            if key in entries:
+                entries.move_to_end(key)
+                self.exact_hits += 1
+                return entries[key]["result"]
+            if not semantic or not entries:
+                self.misses += 1
+                return None
+
+        vector = self._embed(question)
+
+        with self._lock:
+            entries = self._personality_entries(personality_id, version)
+            keys = [k for k, entry in entries.items() if entry["vector"] is not None]
+            if keys:
+                matrix = np.stack([entries[k]["vector"] for k in keys])
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entries.move_to_end(keys[best])
+                    self.semantic_hits += 1
+                    return entries[keys[best]]["result"]
+
+            self.misses += 1
+            return None
+
+    def store(self, personality_id, question, result, version=None, semantic=True):
+        """Cache the answer to a question (version and semantic as for lookup)"""
+        vector = self._embed(question) if semantic else None
+
+        with self._lock:
+            entries = self._personality_entries(personality_id, version)
+            key = self.key(question)
+            entries[key] = {
+                "vector": vector,
+                "result": result,
+                "created": time.monotonic()
+            }
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def clear(self, personality_id=None):
+        """Drop cached answers for one personality, or for all of them"""
+        with self._lock:
+            if personality_id is None:
+                self._entries.clear()
+                self._versions.clear()
+            else:
+                self._entries.pop(personality_id, None)
+                self._versions.pop(personality_id, None)
+
+    def stats(self):
+        """Hit/miss counters and cache size"""
+        with self._lock:
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "size": sum(len(entries) for entries in self._entries.values())
+            }
@@ -0,0 +1,115 @@
+"""
+Retrieval result cache, so repeated questions skip retrieval and context assembly
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from utils.context import pack_context
+from utils.embedding_cache import normalize_text
+
+# Retrieval results kept per process (0 disables the cache)
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1000"))
+# Packed contexts kept per result; the budget only varies with conversation history
+PACKS_PER_RETRIEVAL = 4
+
+
+class Retrieval:
+    """
+    The chunks retrieved for a question, with the contexts packed from them.
+
+    Cached retrievals are shared between requests, so nothing returned from
+    here may be modified.
+    """
+
+    def __init__(self, documents):
+        """
+        Args:
+            documents: Retrieved chunks, most relevant first
+        """
+        self.documents = documents
+        self.ids = [document.metadata.get("chunk_id") for document in documents]
+        self._packs = {}
+
+    def pack(self, max_tokens, format_sources):
+        """
+        The chunks packed into a context of at most max_tokens tokens
+
+        Args:
+            max_tokens: Tokens available for the context
+            format_sources: Function(documents) returning the sources payload
+
+        Returns:
+            The result of utils.context.pack_context, plus 'sources' formatted
+            from the chunks used
+        """
+        packed = self._packs.get(max_tokens)
+        if packed is None:
+            packed = pack_context(self.documents, max_tokens)
+            packed["sources"] = format_sources(packed["documents"])
+            if len(self._packs) < PACKS_PER_RETRIEVAL:
+                self._packs[max_tokens] = packed
+        return packed
+
+
+class RetrievalCache:
+    """
+    LRU of retrievals keyed by personality, normalized question, number of
+    chunks retrieved and index version.
+
+    The index version changes whenever a personality's index is rebuilt, so
+    results from an older index are never served; invalidate() also drops
+    them right away instead of waiting for them to be evicted.
+    """
+
+    def __init__(self, max_entries=RETRIEVAL_CACHE_SIZE):
+        """
+        Args:
+            max_entries: Maximum cached retrievals (0 disables the cache)
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(personality_id, question, k, index_version):
+        return (personality_id, normalize_text(question), k, index_version)
+
+    def get(self, key):
+        """The cached retrieval for a key, or None"""
+        with self._lock:
+            retrieval = self._entries.get(key)
+            if retrieval is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return retrieval
+
+    def store(self, key, retrieval):
+        """Cache a retrieval; returns it"""
+        if self.max_entries <= 0:
+            return retrieval
+        with self._lock:
+            self._entries[key] = retrieval
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return retrieval
+
+    def invalidate(self, personality_id, index_version=None):
+        """Drop a personality's retrievals, except those from index_version"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == personality_id and key[3] != index_version]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters and cache size"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
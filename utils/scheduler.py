@@ -0,0 +1,507 @@
+"""
+Client-side scheduling of upstream (OpenAI) calls
+
+Every LLM and embedding call goes through the process-wide `upstream`
+scheduler, which:
+
+    - spaces calls with a token bucket (UPSTREAM_RATE calls per second in
+      bursts of up to UPSTREAM_BURST; unlimited when UPSTREAM_RATE is 0),
+      and holds every call back for as long as OpenAI asks after a 429
+    - caps the calls in flight at UPSTREAM_CONCURRENCY (async calls share
+      utils.admission's limit and load shedding)
+    - retries 429s, server errors and connection errors up to
+      UPSTREAM_RETRIES times (or as many as retry_scope() allows), backing
+      off as long as a 429 asks
+    - gives up once the current request's deadline has passed, whether the
+      call is still waiting or already running: async calls are cancelled,
+      sync calls get the time left as their HTTP timeout and streams stop
+      between chunks
+
+Deadlines are set per request with deadline_scope() and follow the request
+through contextvars. Identical questions asked while one is already being
+answered wait for that answer instead of making their own calls
+(`coalesced_requests`).
+"""
+
+import os
+import sys
+import time
+import math
+import random
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from utils.admission import UPSTREAM_CONCURRENCY, upstream_admission
+from utils import metrics
+
+# Sustained upstream calls per second (0 = unlimited) and the burst allowed
+UPSTREAM_RATE = float(os.getenv("UPSTREAM_RATE", "0"))
+UPSTREAM_BURST = int(os.getenv("UPSTREAM_BURST", "20"))
+# Longest a chat request may take, in seconds; clients can ask for less
+CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE", "30"))
+# Pause after a 429 that doesn't say how long to wait
+RATE_LIMIT_PAUSE = float(os.getenv("RATE_LIMIT_PAUSE", "1"))
+# Retries of a failed call (429s, 5xx, connection errors), with exponential backoff
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+RETRY_BACKOFF = 0.5
+RETRY_MAX_BACKOFF = 8.0
+
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+_retries = contextvars.ContextVar("upstream_retries", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time waiting for or making an upstream call"""
+
+
+class RateLimited(Exception):
+    """Raised when OpenAI still answers 429 after the client's own retries"""
+
+    status_code = 429
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def deadline_seconds(requested=None):
+    """
+    Time allowed for a request: CHAT_DEADLINE, or less if the client asked
+
+    Args:
+        requested: Seconds asked for by the client (e.g. an X-Request-Timeout
+                   header), ignored unless it is a positive number
+    """
+    try:
+        requested = float(requested)
+    except (TypeError, ValueError):
+        return CHAT_DEADLINE
+    if not 0 < requested < CHAT_DEADLINE:
+        return CHAT_DEADLINE
+    return requested
+
+
+@contextmanager
+def deadline_scope(seconds):
+    """Give the calls made in this context until `seconds` from now (or less, if nested)"""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def retry_scope(retries):
+    """Allow the calls made in this context `retries` retries instead of the scheduler's own"""
+    token = _retries.set(retries)
+    try:
+        yield
+    finally:
+        _retries.reset(token)
+
+
+def remaining():
+    """Seconds left before the current deadline, or None without one"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_deadline():
+    left = remaining()
+    if left is not None and left <= 0:
+        metrics.record_upstream_event("deadline_exceeded")
+        raise DeadlineExceeded("Request deadline exceeded")
+
+
+async def within_deadline(awaitable):
+    """Await something, cancelling it if the current deadline passes first"""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(left, 0))
+    except asyncio.TimeoutError:
+        metrics.record_upstream_event("deadline_exceeded")
+        raise DeadlineExceeded("Request deadline exceeded")
+
+
+def rate_limit_delay(error):
+    """
+    Seconds to back off for if an error is a 429, else None
+
+    Reads retry-after-ms / retry-after from the response when there is one.
+    """
+    if getattr(error, "status_code", None) != 429:
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[name]) * scale
+        except (KeyError, TypeError, ValueError):
+            continue
+    return RATE_LIMIT_PAUSE
+
+
+def is_retryable(error):
+    """True for rate limits, server errors and connection errors (including timeouts)"""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    # An OpenAI error means the SDK is loaded already; don't import it just to check
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(error, openai.APIConnectionError)
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations instead of blocking, so sync
+    and async callers can each wait their own way.
+    """
+
+    def __init__(self, rate=UPSTREAM_RATE, burst=UPSTREAM_BURST):
+        """
+        Args:
+            rate: Tokens added per second (0 = unlimited)
+            burst: Most tokens the bucket holds
+        """
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token; returns how long to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.paused_until - now)
+            if self.rate > 0:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # Going negative reserves a token that hasn't been added yet
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def refund(self):
+        """Give back a reserved token that won't be used"""
+        with self._lock:
+            if self.rate > 0:
+                self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds):
+        """Hold every reservation back for the next `seconds`"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.capacity,
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 3)
+            }
+
+
+class UpstreamScheduler:
+    """
+    Rate limit, concurrency cap, retries and deadlines around upstream calls.
+
+    The OpenAI clients are built without retries of their own (see
+    utils.clients): a retry made here waits for the token bucket like any
+    other call and is never started once the deadline can't be met.
+
+    Usage:
+        response = upstream.call(llm.invoke, prompt, timeout_arg="timeout")
+        response = await upstream.acall(llm.ainvoke, prompt)
+        for chunk in upstream.stream(llm.stream, prompt, timeout_arg="timeout"):
+            ...
+    """
+
+    def __init__(self, bucket=None, limit=UPSTREAM_CONCURRENCY, admission=upstream_admission,
+                 retries=UPSTREAM_RETRIES):
+        """
+        Args:
+            bucket: TokenBucket spacing the calls
+            limit: Maximum sync calls in flight at once
+            admission: AdmissionController bounding async calls
+            retries: Retries of a call that failed with a retryable error
+        """
+        self.bucket = bucket if bucket is not None else TokenBucket()
+        self.limit = limit
+        self.admission = admission
+        self.retries = retries
+        self.calls = 0
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(limit)
+        self._counter_lock = threading.Lock()
+
+    def _token_wait(self):
+        """Reserve a token; returns the wait, or raises if it outlasts the deadline"""
+        wait = self.bucket.reserve()
+        left = remaining()
+        if left is not None and wait >= left:
+            self.bucket.refund()
+            metrics.record_upstream_event("deadline_exceeded")
+            raise DeadlineExceeded("Request deadline exceeded waiting for the upstream rate limit")
+        if wait > 0:
+            metrics.record_upstream_event("throttled")
+        return wait
+
+    def _retry_delay(self, error, attempt):
+        """Seconds to wait before retrying a failed call, or None to give up"""
+        retries = _retries.get()
+        if retries is None:
+            retries = self.retries
+        if attempt >= retries or not is_retryable(error):
+            return None
+        delay = rate_limit_delay(error)
+        if delay is not None:
+            # Every caller backs off; this one waits for the bucket like the rest
+            self.bucket.pause(delay)
+            delay = 0.0
+        else:
+            delay = min(RETRY_MAX_BACKOFF, RETRY_BACKOFF * (2 ** attempt)) * random.uniform(0.5, 1.0)
+        left = remaining()
+        if left is not None and delay >= left:
+            return None
+        metrics.record_upstream_event("retried")
+        return delay
+
+    def _raise(self, error):
+        """
+        Raise the error for a call that won't be retried: RateLimited for a
+        429 (pausing every caller for as long as asked), DeadlineExceeded for
+        one that failed because it ran out of time (e.g. an HTTP timeout),
+        else the error itself
+        """
+        if isinstance(error, (RateLimited, DeadlineExceeded)):
+            raise error
+        delay = rate_limit_delay(error)
+        if delay is not None:
+            self.bucket.pause(delay)
+            metrics.record_upstream_event("rate_limited")
+            raise RateLimited(f"Upstream rate limit reached: {str(error)}", max(delay, RATE_LIMIT_PAUSE)) from error
+        left = remaining()
+        if left is not None and left <= 0:
+            metrics.record_upstream_event("deadline_exceeded")
+            raise DeadlineExceeded("Request deadline exceeded") from error
+        raise error
+
+    def _acquire_slot(self):
+        left = remaining()
+        if not self._slots.acquire(timeout=max(left, 0) if left is not None else None):
+            metrics.record_upstream_event("deadline_exceeded")
+            raise DeadlineExceeded("Request deadline exceeded waiting for an upstream slot")
+        with self._counter_lock:
+            self.calls += 1
+            self.in_flight += 1
+
+    def _release_slot(self):
+        with self._counter_lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _with_timeout(self, timeout_arg, kwargs):
+        left = remaining()
+        if timeout_arg and left is not None:
+            kwargs = dict(kwargs, **{timeout_arg: max(left, 0.001)})
+        return kwargs
+
+    def call(self, fn, *args, timeout_arg=None, **kwargs):
+        """
+        Make a blocking upstream call
+
+        Args:
+            fn: The call, e.g. llm.invoke
+            timeout_arg: Keyword through which fn accepts a timeout in seconds;
+                         when given, the time left before the deadline is passed
+        """
+        attempt = 0
+        while True:
+            time.sleep(self._token_wait())
+            self._acquire_slot()
+            try:
+                check_deadline()
+                return fn(*args, **self._with_timeout(timeout_arg, kwargs))
+            except Exception as e:
+                error = e
+            finally:
+                self._release_slot()
+
+            delay = self._retry_delay(error, attempt)
+            if delay is None:
+                self._raise(error)
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, fn, *args, **kwargs):
+        """Await an upstream coroutine function, cancelling it at the deadline"""
+        return await within_deadline(self._acall(fn, *args, **kwargs))
+
+    async def _acall(self, fn, *args, **kwargs):
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._token_wait())
+            try:
+                async with self.admission:
+                    with self._counter_lock:
+                        self.calls += 1
+                    return await fn(*args, **kwargs)
+            except Exception as e:
+                error = e
+
+            delay = self._retry_delay(error, attempt)
+            if delay is None:
+                self._raise(error)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stream(self, fn, *args, timeout_arg=None, **kwargs):
+        """
+        Iterate over a streaming upstream call, stopping at the deadline
+
+        The slot is held until the stream is exhausted or closed. A stream is
+        only retried if it failed before its first chunk.
+        """
+        attempt = 0
+        while True:
+            time.sleep(self._token_wait())
+            self._acquire_slot()
+            started = False
+            try:
+                check_deadline()
+                chunks = fn(*args, **self._with_timeout(timeout_arg, kwargs))
+                try:
+                    for chunk in chunks:
+                        started = True
+                        yield chunk
+                        check_deadline()
+                    return
+                finally:
+                    close = getattr(chunks, "close", None)
+                    if close is not None:
+                        close()
+            except Exception as e:
+                error = e
+            finally:
+                self._release_slot()
+
+            delay = None if started else self._retry_delay(error, attempt)
+            if delay is None:
+                self._raise(error)
+            time.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        return dict(self.bucket.stats(), limit=self.limit, calls=self.calls, in_flight=self.in_flight)
+
+
+class LeaderGaveUp(Exception):
+    """The call a follower was waiting on stopped for the leader's own reasons"""
+
+
+class SingleFlight:
+    """
+    Collapses identical concurrent calls into one.
+
+    The first caller for a key runs the call; callers arriving while it is
+    in flight wait for its result (or exception) instead, each until its own
+    deadline. Sync and async callers share the same in-flight calls.
+
+    Only the call's own outcome is shared. If the leader runs out of its
+    deadline or is cancelled (its client went away), the followers start
+    over: one of them makes the call and the rest wait for it.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key):
+        """The in-flight call for a key, and whether this caller has to make it"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                metrics.record_upstream_event("coalesced")
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            del self._calls[key]
+        if error is None:
+            future.set_result(result)
+        elif isinstance(error, DeadlineExceeded) or not isinstance(error, Exception):
+            # The leader's deadline or cancellation says nothing about the followers'
+            future.set_exception(LeaderGaveUp())
+        else:
+            future.set_exception(error)
+
+    def do(self, key, fn):
+        """Run fn(), or wait for the identical call already running"""
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            left = remaining()
+            try:
+                return dict(future.result(timeout=max(left, 0) if left is not None else None), coalesced=True)
+            except FutureTimeoutError:
+                metrics.record_upstream_event("deadline_exceeded")
+                raise DeadlineExceeded("Request deadline exceeded waiting for an identical request")
+            except LeaderGaveUp:
+                check_deadline()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def ado(self, key, fn):
+        """Await fn(), or wait for the identical call already running"""
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                break
+            try:
+                # Shielded so a follower giving up doesn't cancel the shared call
+                result = await within_deadline(asyncio.shield(asyncio.wrap_future(future)))
+                return dict(result, coalesced=True)
+            except LeaderGaveUp:
+                check_deadline()
+
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls)}
+
+
+def retry_after_header(error):
+    """Retry-After value (whole seconds) for a RateLimited error"""
+    return str(max(1, math.ceil(error.retry_after)))
+
+
+# Shared by every thread and coroutine in the process
+upstream = UpstreamScheduler()
+coalesced_requests = SingleFlight()
@@ -0,0 +1,106 @@
+"""
+Token counting for prompt budgets and chunk sizes
+
+TOKENIZER picks how tokens are counted: 'tiktoken' uses the chat model's
+encoding, which tiktoken downloads on first use (set TIKTOKEN_CACHE_DIR to
+keep a copy), and 'estimate' counts CHARS_PER_TOKEN characters per token
+without ever needing the network. Chunk sizes, and so the index, are tied
+to the configured tokenizer: building chunks fails rather than silently
+estimating when the encoding can't be loaded. Prompt budgets fall back to
+estimates until it can.
+"""
+
+import os
+import time
+import threading
+
+TOKENIZER = os.getenv("TOKENIZER", "tiktoken")
+TOKENIZER_MODEL = os.getenv("TOKENIZER_MODEL", os.getenv("LLM_MODEL", "gpt-4o-mini"))
+# Seconds before trying to load the encoding again after it failed to load
+TOKENIZER_RETRY_INTERVAL = 300
+
+# Rough size of a token in characters, for when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_failed_at = None
+_lock = threading.Lock()
+
+
+class TokenizerUnavailable(Exception):
+    """Raised when sizes that end up in the index can't be counted with the configured tokenizer"""
+
+
+def encoding_name():
+    """Name of the chat model's tiktoken encoding, without loading it"""
+    from tiktoken.model import encoding_name_for_model
+    try:
+        return encoding_name_for_model(TOKENIZER_MODEL)
+    except KeyError:
+        return "o200k_base"
+
+
+def get_encoding():
+    """The tiktoken encoding for the chat model, or None if it isn't used or can't be loaded"""
+    global _encoding, _failed_at
+    if TOKENIZER == "estimate":
+        return None
+    if _encoding is None and (_failed_at is None or time.monotonic() - _failed_at > TOKENIZER_RETRY_INTERVAL):
+        with _lock:
+            if _encoding is None and (_failed_at is None or time.monotonic() - _failed_at > TOKENIZER_RETRY_INTERVAL):
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(encoding_name())
+                except Exception as e:
+                    # tiktoken downloads its vocabulary on first use; don't retry on every count
+                    print(f"Falling back to estimated token counts: {str(e)}")
+                    _failed_at = time.monotonic()
+    return _encoding
+
+
+def require_encoding():
+    """
+    The configured tokenizer, for sizes recorded in the index
+
+    Returns:
+        The tiktoken encoding, or None when TOKENIZER is 'estimate'
+
+    Raises:
+        TokenizerUnavailable: The encoding can't be loaded
+    """
+    if TOKENIZER == "estimate":
+        return None
+    encoding = get_encoding()
+    if encoding is None:
+        raise TokenizerUnavailable(
+            f"Can't load the {encoding_name()} tokenizer to size chunks. Set TIKTOKEN_CACHE_DIR to a "
+            f"directory holding its vocabulary, or TOKENIZER=estimate to size them by characters"
+        )
+    return encoding
+
+
+def tokenizer_name():
+    """Name of the configured tokenizer, recorded with anything sized in tokens"""
+    if TOKENIZER == "estimate":
+        return f"estimate-{CHARS_PER_TOKEN}cpt"
+    return encoding_name()
+
+
+def count_tokens(text):
+    """Number of tokens in text (estimated when tiktoken is unavailable)"""
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens):
+    """Cut text down to at most max_tokens tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = get_encoding()
+    if encoding is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])